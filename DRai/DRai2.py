@@ -3,25 +3,40 @@ import json
 import time
 import pandas as pd
 import sys
+import argparse
 from dotenv import load_dotenv
 import google.generativeai as genai
 from google.generativeai.types import BlockedPromptException
+from feedback_dedup import group_feedbacks, fan_out
+from cascade import local_sentiment_label, FULL_LLM_OUTPUT, CASCADE_OUTPUT, SOURCE_COLUMN
+
+# 共用模組（模型呼叫韌性層等）放在專案根目錄
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_resilience import ResilientCaller
+from model_router import model_router
 
 # 載入 API 金鑰
 load_dotenv()
 genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
 
+# 模型呼叫：暫時性錯誤自動重試、API 故障時斷路；慢回應對沖會重複計費，設定 LLM_HEDGE=1 才開啟
+gemini_caller = ResilientCaller()
+
 #HW2
 def summarize_feedback_batch(feedbacks, scores):
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
         prompt = "請根據以下每筆員工回饋與滿意度，用一句話總結並判斷是正面還是負面，輸出格式為：\n\n" \
                  "員工ID：XXX\n反饋總結：XXX\n正負面評分：正面/負面\n\n"
 
         for i in range(len(feedbacks)):
             prompt += f"員工ID：{feedbacks[i]['id']}\n近期反饋：「{feedbacks[i]['text']}」，滿意度為 {feedbacks[i]['score']} 分。\n\n"
 
-        response = model.generate_content(prompt)
+        # 依路由政策選擇摘要任務的模型
+        response = model_router.call(
+            "summarization",
+            lambda model_name: gemini_caller.call(genai.GenerativeModel(model_name).generate_content, prompt),
+            caller=gemini_caller
+        )
 
         result_blocks = response.text.strip().split("\n\n")
         parsed_results = []
@@ -50,43 +65,128 @@ def summarize_feedback_batch(feedbacks, scores):
         return [{"員工ID": fb["id"], "正負面評分": "", "反饋總結": "分析失敗"} for fb in feedbacks]
 
 
+def cascade_summarize(feedbacks, low, high, batch_size=25):
+    """
+    串接模式：SnowNLP 分數落在 (low, high) 之外的高信心反饋由本地直接標註，
+    不確定區間內的反饋集中後每 batch_size 筆呼叫一次 summarize_feedback_batch。
+    每筆結果多一個「標註來源」欄位（本地 / LLM），並依原始順序回傳。
+    回傳 (結果清單, LLM 呼叫次數)。
+    """
+    local_results = {}
+    uncertain = []
+    for fb in feedbacks:
+        label, score = local_sentiment_label(fb["text"], low, high)
+        if label is None:
+            uncertain.append(fb)
+        else:
+            local_results[str(fb["id"])] = {
+                "員工ID": fb["id"],
+                "正負面評分": label,
+                # 本地標註不產生摘要，避免原文被誤當成 LLM 總結
+                "反饋總結": "",
+                SOURCE_COLUMN: "本地",
+                "本地情緒分數": round(score, 4)
+            }
+
+    llm_results = {}
+    llm_calls = 0
+    for i in range(0, len(uncertain), batch_size):
+        batch_input = uncertain[i:i+batch_size]
+        print(f"\n🔄 LLM 處理不確定反饋第 {i+1} 到 {i+len(batch_input)} 筆...")
+        for r in summarize_feedback_batch(batch_input, None):
+            r[SOURCE_COLUMN] = "LLM"
+            llm_results[str(r["員工ID"])] = r
+        llm_calls += 1
+        time.sleep(2)
+
+    results = []
+    for fb in feedbacks:
+        key = str(fb["id"])
+        if key in local_results:
+            results.append(local_results[key])
+        elif key in llm_results:
+            results.append(llm_results[key])
+        else:
+            # LLM 回傳漏掉這筆時，保留失敗紀錄以免資料遺失
+            results.append({"員工ID": fb["id"], "正負面評分": "", "反饋總結": "分析失敗", SOURCE_COLUMN: "LLM"})
+
+    return results, llm_calls
+
+
 
 def main():
+    parser = argparse.ArgumentParser(description="員工反饋總結與正負面判斷")
+    parser.add_argument("input_csv", help="CSV路徑")
+    parser.add_argument("--cascade", nargs=2, type=float, metavar=("LOW", "HIGH"),
+                        help="串接模式：SnowNLP 分數 <= LOW 或 >= HIGH 的反饋在本地標註，其餘才送給 LLM。"
+                             "範例資料量測：0.3 0.7 呼叫減半、一致率 72%%；0.1 0.9 不省呼叫、一致率 88%%。"
+                             "請先用 bench_cascade.py 比較")
+    parser.add_argument("--output", help=f"輸出 CSV（預設 {FULL_LLM_OUTPUT}，串接模式為 {CASCADE_OUTPUT}）")
+    parser.add_argument("--dedup", action="store_true", help="相同反饋只送一次 LLM，結果再分配回每位員工")
+    parser.add_argument("--hedge", action="store_true", help="慢回應時送出重複請求（會重複計費）")
     if len(sys.argv) < 2:
-        print("用法：python employee_summary_bot.py <CSV路徑>")
+        print("用法：python DRai2.py <CSV路徑> [--cascade LOW HIGH] [--dedup] [--hedge] [--output CSV]")
         return
+    args = parser.parse_args()
+    if args.hedge:
+        gemini_caller.hedge = True
 
-    input_csv = sys.argv[1]
-    output_csv = "employee_feedback_summary.csv"
+    input_csv = args.input_csv
+    # 串接模式的結果另存，避免覆蓋基準測試用的全 LLM 參考結果
+    output_csv = args.output or (CASCADE_OUTPUT if args.cascade else FULL_LLM_OUTPUT)
 
     df = pd.read_csv(input_csv)
     results = []
+#HW2
+    all_input = []
+    for _, row in df.iterrows():
+        all_input.append({
+            "id": row["員工ID"],
+            "text": row["近期反饋內容"],
+            "score": row["員工滿意度評分"]
+        })
+
+    # 去重模式：相同反饋（正規化後）且同一滿意度區間的員工只送一次
+    if args.dedup:
+        groups = group_feedbacks(all_input)
+        items = [g["representative"] for g in groups]
+        print(f"🧹 去重後 {len(all_input)} 筆反饋合併為 {len(items)} 組")
+    else:
+        items = all_input
 
     batch_size = 25
     results = []
+    llm_calls = 0
 
-    for i in range(0, len(df), batch_size):
-        batch = df.iloc[i:i+batch_size]
-        print(f"\n🔄 處理第 {i+1} 到 {i+len(batch)} 筆...")
-#HW2
-        batch_input = []
-        for _, row in batch.iterrows():
-            batch_input.append({
-                "id": row["員工ID"],
-                "text": row["近期反饋內容"],
-                "score": row["員工滿意度評分"]
-            })
+    if args.cascade:
+        # 先在本地標註全部反饋，不確定的集中成批，減少 API 呼叫次數
+        low, high = args.cascade
+        results, llm_calls = cascade_summarize(items, low, high, batch_size)
+    else:
+        for i in range(0, len(items), batch_size):
+            batch_input = items[i:i+batch_size]
+            print(f"\n🔄 處理第 {i+1} 到 {i+len(batch_input)} 筆...")
 
-        batch_result = summarize_feedback_batch(batch_input, None)
-        results.extend(batch_result)
+            batch_result = summarize_feedback_batch(batch_input, None)
+            results.extend(batch_result)
+            llm_calls += 1
 
-        time.sleep(2)
+            time.sleep(2)
+
+    if args.dedup:
+        results = fan_out(results, groups, all_input)
 
 
 
     output_df = pd.DataFrame(results)
     output_df.to_csv(output_csv, index=False, encoding="utf-8-sig")
     print(f"分析完成！結果已寫入 {output_csv}")
+    print(f"📊 共 {len(output_df)} 筆結果，LLM 呼叫 {llm_calls} 次")
+    print(f"📊 {gemini_caller.report()}")
+    print(f"📊 模型路由：{model_router.report()}")
+    if args.cascade:
+        llm_rows = int((output_df[SOURCE_COLUMN] == "LLM").sum())
+        print(f"📊 LLM 標註 {llm_rows} 筆，本地標註 {len(output_df) - llm_rows} 筆")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,58 @@
+import sys
+import time
+import pandas as pd
+from snownlp import SnowNLP
+from cascade import band_label, FULL_LLM_OUTPUT, SOURCE_COLUMN
+
+# 串接模式基準測試（離線，不呼叫 API）
+# 以先前整批送 LLM 的結果（DRai2.py 不加 --cascade 的輸出）作為參考標籤，
+# 比較不同不確定區間下：LLM 呼叫減少多少、本地標註與 LLM 標註的一致率。
+# 用法：python bench_cascade.py [原始CSV] [LLM結果CSV]
+
+BATCH_SIZE = 25
+BANDS = [(0.5, 0.5), (0.4, 0.6), (0.3, 0.7), (0.2, 0.8), (0.1, 0.9)]
+
+
+def main():
+    input_csv = sys.argv[1] if len(sys.argv) > 1 else "employee.csv"
+    reference_csv = sys.argv[2] if len(sys.argv) > 2 else FULL_LLM_OUTPUT
+
+    df = pd.read_csv(input_csv)
+    reference = pd.read_csv(reference_csv)
+    # 串接模式的輸出含本地標註，拿來當參考等於和自己比較
+    if SOURCE_COLUMN in reference.columns:
+        print(f"❌ {reference_csv} 是串接模式的輸出（含「{SOURCE_COLUMN}」欄位），請改用全部送 LLM 的結果作為參考")
+        sys.exit(1)
+    df["員工ID"] = df["員工ID"].astype(str)
+    reference["員工ID"] = reference["員工ID"].astype(str)
+    df = pd.merge(df, reference[["員工ID", "正負面評分"]], on="員工ID", how="inner")
+
+    start = time.perf_counter()
+    df["本地情緒分數"] = df["近期反饋內容"].apply(lambda text: SnowNLP(str(text)).sentiments)
+    elapsed = time.perf_counter() - start
+    print(f"🔎 SnowNLP 打分 {len(df)} 筆，耗時 {elapsed * 1000:.1f} ms（{elapsed / max(len(df), 1) * 1000:.2f} ms/筆）")
+
+    baseline_calls = (len(df) + BATCH_SIZE - 1) // BATCH_SIZE
+    rows = []
+    for low, high in BANDS:
+        labels = df["本地情緒分數"].apply(lambda s: band_label(s, low, high))
+        local_mask = labels.notna()
+
+        # 不確定的反饋集中後每 BATCH_SIZE 筆呼叫一次 LLM
+        local_count = int(local_mask.sum())
+        calls = (len(df) - local_count + BATCH_SIZE - 1) // BATCH_SIZE
+        agree = int((labels[local_mask] == df.loc[local_mask, "正負面評分"]).sum())
+        rows.append({
+            "不確定區間": f"({low}, {high})",
+            "本地標註筆數": local_count,
+            "LLM標註筆數": len(df) - local_count,
+            "LLM呼叫次數": f"{calls}/{baseline_calls}",
+            "送出筆數減少": f"{local_count / len(df):.0%}",
+            "本地一致率": f"{agree / local_count:.0%}" if local_count else "-"
+        })
+
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+from snownlp import SnowNLP
+
+# 串接模式共用設定：DRai2.py 與 bench_cascade.py 都從這裡取用，避免兩邊各寫一份。
+# 不設預設的不確定區間，使用者需自行以 --cascade LOW HIGH 指定。
+# bench_cascade.py 在 50 筆範例資料上的量測結果（25 筆一批）：
+#   (0.3, 0.7)：LLM 呼叫 2 → 1 次，本地標註 78%，與 LLM 一致率 72%
+#   (0.2, 0.8)：LLM 呼叫 2 → 1 次，本地標註 58%，一致率 69%
+#   (0.1, 0.9)：LLM 呼叫 2 → 2 次（不省呼叫），本地標註 32%，一致率 88%（僅 16 筆）
+# 區間越窄省下越多 LLM 呼叫，但本地標註錯誤越多；請先以自己的資料跑基準測試再決定。
+
+# 全部送 LLM 的輸出（也是基準測試的參考標籤）與串接模式的輸出分開存放
+FULL_LLM_OUTPUT = "employee_feedback_summary.csv"
+CASCADE_OUTPUT = "employee_feedback_summary_cascade.csv"
+SOURCE_COLUMN = "標註來源"
+
+
+def band_label(score, low, high):
+    """分數 >= high 判為正面，<= low 判為負面，落在中間回傳 None（需要交給 LLM）。"""
+    if score >= high:
+        return "正面"
+    if score <= low:
+        return "負面"
+    return None
+
+
+def local_sentiment_label(text, low, high):
+    """用 SnowNLP 對單筆反饋打分（0~1），回傳 (標籤或 None, 分數)。"""
+    score = SnowNLP(str(text)).sentiments
+    return band_label(score, low, high), score
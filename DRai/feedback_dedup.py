@@ -0,0 +1,67 @@
+import re
+import math
+
+# 反饋去重：員工反饋多半來自少數固定句子，
+# 將「正規化後文字 + 滿意度區間」相同的員工合併成一組，
+# 每組只送一次 LLM，再把結果分配回組內每位員工。
+
+# 正規化時忽略的結尾標點
+TRAILING_PUNCTUATION = "。．.！!？?，,；;、 "
+
+
+def normalize_feedback(text):
+    """去除空白與結尾標點，讓只差在格式的反饋能視為同一句。"""
+    if text is None or (isinstance(text, float) and math.isnan(text)):
+        return ""
+    text = re.sub(r"\s+", "", str(text))
+    return text.rstrip(TRAILING_PUNCTUATION)
+
+
+def score_bucket(score):
+    """滿意度四捨五入到整數分作為區間；無法解析時回傳 None。"""
+    try:
+        value = float(score)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(value):
+        return None
+    return int(round(value))
+
+
+def group_feedbacks(feedbacks, text_key="text", score_key="score"):
+    """
+    feedbacks 為 dict 清單（至少含 id、text_key、score_key）。
+    回傳分組清單，每組為 {"representative": 代表資料, "ids": [組內所有員工ID]}，
+    順序依各組第一次出現的位置。
+    """
+    groups = {}
+    for fb in feedbacks:
+        key = (normalize_feedback(fb[text_key]), score_bucket(fb[score_key]))
+        if key not in groups:
+            groups[key] = {"representative": fb, "ids": []}
+        groups[key]["ids"].append(fb["id"])
+    return list(groups.values())
+
+
+def fan_out(results, groups, feedbacks, id_field="員工ID"):
+    """
+    將代表資料的分析結果複製給組內每位員工，並依 feedbacks 的原始順序回傳。
+    LLM 漏掉的代表資料，其整組員工也不會出現在結果中（與未去重時行為一致）。
+    """
+    by_representative = {str(r.get(id_field, "")): r for r in results}
+    result_for_id = {}
+    for g in groups:
+        r = by_representative.get(str(g["representative"]["id"]))
+        if r is None:
+            continue
+        for emp_id in g["ids"]:
+            result_for_id[str(emp_id)] = r
+
+    fanned = []
+    for fb in feedbacks:
+        r = result_for_id.get(str(fb["id"]))
+        if r is not None:
+            item = dict(r)
+            item[id_field] = fb["id"]
+            fanned.append(item)
+    return fanned
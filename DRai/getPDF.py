@@ -1,4 +1,8 @@
 import os
+import sys
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import pandas as pd
 import gradio as gr
@@ -6,12 +10,42 @@ from dotenv import load_dotenv
 from fpdf import FPDF
 import re
 import google.generativeai as genai
+from feedback_dedup import group_feedbacks, fan_out
+
+# 共用模組（模型呼叫韌性層等）放在專案根目錄
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_resilience import ResilientCaller
+from model_router import model_router
 
 # 載入 API 金鑰
 load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
 genai.configure(api_key=api_key)
-model = genai.GenerativeModel("gemini-1.5-pro")  # 或 "gemini-1.0-pro"
+# 逐筆情緒評分屬於簡單分類任務，由路由器選用快速模型（不再固定使用 gemini-1.5-pro）
+models = {}
+
+def get_model(model_name: str):
+    if model_name not in models:
+        models[model_name] = genai.GenerativeModel(model_name)
+    return models[model_name]
+
+# 模型呼叫：暫時性錯誤自動重試、API 故障時斷路；慢回應對沖會重複計費，設定 LLM_HEDGE=1 才開啟
+gemini_caller = ResilientCaller()
+
+# 併發設定：全站同時產生的報表數、排隊上限、每位使用者同時產生的報表數
+MAX_CONCURRENT_REPORTS = 4
+QUEUE_MAX_SIZE = 20
+MAX_REPORTS_PER_USER = 1
+
+# 分析完成後 PDF 交給背景執行緒產生，並由另一個排隊群組取回，
+# 分析的併發名額與使用者名額在表格完成時就釋放
+pdf_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REPORTS)
+pdf_jobs = {}
+# 使用者中途離開、沒有取回的 PDF，完成後保留的秒數
+PDF_JOB_TTL = 600
+# 每位使用者目前進行中的報表數；歸零即移除，不會隨瀏覽器工作階段累積
+active_reports = {}
+active_reports_lock = threading.Lock()
 
 
 # 嘗試取得中文字型（Windows）
@@ -102,15 +136,28 @@ def generate_pdf(text: str = None, df: pd.DataFrame = None) -> str:
     else:
         pdf.cell(0, 10, "⚠ 沒有可呈現的內容")
 
-    filename = f"employee_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    # 加上微秒，避免多位使用者同一秒產生報表時檔名衝突
+    filename = f"employee_report_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.pdf"
     pdf.output(filename)
     print("PDF 生成完成：", filename)
     return filename
 
-# 使用 Gemini API 對每筆員工資料進行分析
-def analyze_employee_feedback(df: pd.DataFrame, user_prompt: str, max_batch_size: int = 25, max_rows: int = 50) -> pd.DataFrame:
+# 使用 Gemini API 對每筆員工資料進行分析，每完成一批就產生該批結果
+def iter_employee_feedback(df: pd.DataFrame, user_prompt: str, max_batch_size: int = 25, max_rows: int = 50, dedup: bool = False):
+    # 去重模式：相同反饋且同一滿意度區間的員工只分析一次，max_rows 改為限制組數
+    source_df = df
+    if dedup:
+        feedbacks = [
+            {"id": row["員工ID"], "text": row["近期反饋內容"], "score": row["員工滿意度評分"]}
+            for _, row in df.iterrows()
+        ]
+        groups = group_feedbacks(feedbacks)
+        representative_ids = {str(g["representative"]["id"]) for g in groups}
+        source_df = df[df["員工ID"].astype(str).isin(representative_ids)]
+        print(f"去重後 {len(df)} 筆反饋合併為 {len(source_df)} 組")
+
     # 獲取 CSV 總筆數
-    total_rows = len(df)
+    total_rows = len(source_df)
     
     # 如果筆數小於或等於 max_rows，則不分批，直接處理所有資料
     if total_rows <= max_rows:
@@ -118,11 +165,10 @@ def analyze_employee_feedback(df: pd.DataFrame, user_prompt: str, max_batch_size
     else:
         batch_size = max_batch_size  # 超過 max_rows，分批處理
     
-    results = []
-    
     # 根據批次大小進行資料分批處理
     for start in range(0, min(total_rows, max_rows), batch_size):
-        batch = df.iloc[start:start + batch_size]
+        results = []
+        batch = source_df.iloc[start:start + batch_size]
         combined_prompt = "請針對以下每筆資料進行分析，回傳格式請嚴格遵守：\n員工ID: XXX\n情緒分數: 整數分數\n改善建議: 建議內容\n\n"
         
         for _, row in batch.iterrows():
@@ -133,7 +179,11 @@ def analyze_employee_feedback(df: pd.DataFrame, user_prompt: str, max_batch_size
             )
         
         try:
-            response = model.generate_content(combined_prompt)
+            response = model_router.call(
+                "row_classification",
+                lambda model_name: gemini_caller.call(get_model(model_name).generate_content, combined_prompt),
+                caller=gemini_caller
+            )
             lines = response.text.strip().split("\n")
             
             temp_result = {}
@@ -160,21 +210,90 @@ def analyze_employee_feedback(df: pd.DataFrame, user_prompt: str, max_batch_size
                     "改善建議": "API 發生錯誤或額度不足"
                 })
 
+        # 將每組的分析結果分配回組內所有員工
+        if dedup:
+            results = fan_out(results, groups, feedbacks)
+
+        yield results
+
+def analyze_employee_feedback(df: pd.DataFrame, user_prompt: str, max_batch_size: int = 25, max_rows: int = 50, dedup: bool = False) -> pd.DataFrame:
+    results = []
+    for batch_results in iter_employee_feedback(df, user_prompt, max_batch_size, max_rows, dedup):
+        results.extend(batch_results)
+
     # 合併原始資料
     result_df = pd.DataFrame(results)
     merged_df = pd.merge(df, result_df, on="員工ID", how="left")
     return merged_df
 
-# Gradio 處理函式
-def gradio_handler(csv_file, user_prompt):
-    if csv_file is not None:
+def format_summary(results) -> str:
+    summary_df = pd.DataFrame(results).reindex(columns=["員工ID", "情緒分數", "改善建議"])
+    return summary_df.to_string(index=False)
+
+# 限制同一使用者同時產生的報表數；成功取得名額時回傳使用者代號，否則回傳 None
+# 有登入時以帳號區分；未設定登入時以來源 IP 區分（同一台電腦開新分頁也算同一人，
+# 但經由反向代理或 NAT 共用 IP 的使用者會被視為同一人）
+def acquire_user_slot(request: gr.Request):
+    user_key = "anonymous"
+    if request is not None:
+        user_key = request.username or (request.client.host if request.client else None) or user_key
+    with active_reports_lock:
+        if active_reports.get(user_key, 0) >= MAX_REPORTS_PER_USER:
+            return None
+        active_reports[user_key] = active_reports.get(user_key, 0) + 1
+    return user_key
+
+def release_user_slot(user_key):
+    with active_reports_lock:
+        remaining = active_reports.get(user_key, 0) - 1
+        if remaining > 0:
+            active_reports[user_key] = remaining
+        else:
+            active_reports.pop(user_key, None)
+
+# Gradio 處理函式：逐批回傳部分結果；表格完成後把 PDF 交給背景執行緒，回傳 PDF 工作代號
+def gradio_handler(csv_file, user_prompt, dedup=False, request: gr.Request = None):
+    if csv_file is None:
+        yield "⚠ 請上傳包含 員工ID、滿意度、反饋內容 的 CSV。", None, None
+        return
+
+    user_key = acquire_user_slot(request)
+    if user_key is None:
+        yield "⚠ 您已有報表正在產生中，請等待完成後再試。", None, None
+        return
+
+    try:
         df = pd.read_csv(csv_file.name)
-        result_df = analyze_employee_feedback(df, user_prompt)
-        pdf_path = generate_pdf(df=result_df)
+        results = []
+        for batch_results in iter_employee_feedback(df, user_prompt, dedup=dedup):
+            results.extend(batch_results)
+            yield f"⏳ 已完成 {len(results)} 筆分析...\n\n{format_summary(results)}", None, None
+
+        result_df = pd.merge(df, pd.DataFrame(results), on="員工ID", how="left")
+        print(gemini_caller.report())
+        print(f"模型路由：{model_router.report()}")
         summary_text = result_df[["員工ID", "情緒分數", "改善建議"]].to_string(index=False)
-        return summary_text, pdf_path
-    else:
-        return "⚠ 請上傳包含 員工ID、滿意度、反饋內容 的 CSV。", None
+        pdf_job = uuid.uuid4().hex
+        pdf_future = pdf_executor.submit(generate_pdf, df=result_df)
+        pdf_jobs[pdf_job] = (summary_text, pdf_future)
+        # 若使用者在取回前離開，完成後 PDF_JOB_TTL 秒自動移除，避免結果一直留在記憶體
+        pdf_future.add_done_callback(lambda _, job=pdf_job: schedule_pdf_job_cleanup(job))
+        yield f"{summary_text}\n\n📄 PDF 報表產生中...", None, pdf_job
+    finally:
+        release_user_slot(user_key)
+
+def schedule_pdf_job_cleanup(pdf_job):
+    timer = threading.Timer(PDF_JOB_TTL, pdf_jobs.pop, args=(pdf_job, None))
+    timer.daemon = True
+    timer.start()
+
+# 分析結束後的下一步：等待背景 PDF 完成並回傳檔案（佔用的是 PDF 排隊群組，不是分析名額）
+def deliver_pdf(pdf_job):
+    job = pdf_jobs.pop(pdf_job, None) if pdf_job else None
+    if job is None:
+        return gr.update(), None
+    summary_text, pdf_future = job
+    return summary_text, pdf_future.result()
 
 # 預設分析提示
 default_prompt = """根據以下每筆員工的滿意度評分與反饋內容，請回傳每筆資料的情緒分數（0~100）以及一句具體的改善建議。請遵守以下格式來回答每筆員工的資料：
@@ -188,10 +307,16 @@ with gr.Blocks() as demo:
     with gr.Row():
         csv_input = gr.File(label="📂 上傳員工 CSV 檔案")
         user_input = gr.Textbox(label="📝 自訂分析提示", lines=6, value=default_prompt)
+    dedup_input = gr.Checkbox(label="🧹 相同反饋只分析一次", value=False)
     output_text = gr.Textbox(label="📊 分析摘要", interactive=False, lines=15)
     output_pdf = gr.File(label="📄 下載 PDF 報表")
+    pdf_job_state = gr.State()
     submit_button = gr.Button("🚀 開始分析")
-    submit_button.click(fn=gradio_handler, inputs=[csv_input, user_input],
-                        outputs=[output_text, output_pdf])
+    submit_button.click(fn=gradio_handler, inputs=[csv_input, user_input, dedup_input],
+                        outputs=[output_text, output_pdf, pdf_job_state]).then(
+        fn=deliver_pdf, inputs=[pdf_job_state], outputs=[output_text, output_pdf],
+        concurrency_limit=MAX_CONCURRENT_REPORTS, concurrency_id="pdf")
 
+# 啟用排隊：最多同時處理 MAX_CONCURRENT_REPORTS 份報表，其餘請求排隊等待
+demo.queue(default_concurrency_limit=MAX_CONCURRENT_REPORTS, max_size=QUEUE_MAX_SIZE)
 demo.launch()
\ No newline at end of file
@@ -1,14 +1,136 @@
 import os
+import json
+import numpy as np
 import pandas as pd
 import matplotlib
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import seaborn as sns
 from snownlp import SnowNLP
 matplotlib.use('Agg')
 matplotlib.rc('font', family='Microsoft JhengHei')
 
-def generate_satisfaction_trend_plot(dept_id, employee_data):
-    output_dir = "static/satisfactiontrend"
+SATISFACTION_TREND_DIR = "static/satisfactiontrend"
+# 超過此筆數改用大量資料模式：分箱長條、分位數區間與抽樣散點，不再逐人繪製
+LARGE_N_THRESHOLD = 2000
+# 大量資料模式的排名分箱數與散點上限
+RANK_BINS = 200
+MAX_SCATTER_POINTS = 2000
+
+def aggregates_path(dept_id):
+    return os.path.join(SATISFACTION_TREND_DIR, f"satisfaction_trend_{dept_id}.json")
+
+def sentiment_scores(texts):
+    # 用 snownlp 對反饋內容進行情緒分析，映射至 1~5（與滿意度評分同尺度）
+    # 反饋多為重複句子，每種句子只分析一次；沒有反饋內容時與 dashboard 相同視為中性（0.5 → 3）
+    texts = texts.fillna("").astype(str)
+    unique_scores = {text: (SnowNLP(text).sentiments if text else 0.5) * 4 + 1 for text in texts.unique()}
+    return texts.map(unique_scores)
+
+def json_number(value, digits=3):
+    # NaN 不是合法的 JSON，改輸出 null
+    value = float(value)
+    return None if np.isnan(value) else round(value, digits)
+
+def compute_satisfaction_aggregates(plot_data, num_bins=RANK_BINS, max_points=MAX_SCATTER_POINTS):
+    """
+    plot_data 需已依滿意度由高到低排序，並含「反饋情緒分析」欄位。
+    回傳可序列化為 JSON 的彙總：排名分箱統計、兩種評分的直方圖與抽樣散點。
+    """
+    satisfaction = plot_data["員工滿意度評分"].to_numpy(dtype=float)
+    sentiment = plot_data["反饋情緒分析"].to_numpy(dtype=float)
+    n = len(plot_data)
+
+    # 依排名切成 num_bins 段，每段計算滿意度平均與情緒分數的 10/50/90 百分位
+    edges = np.linspace(0, n, min(num_bins, n) + 1).astype(int)
+    rank_bins = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end <= start:
+            continue
+        p10, p50, p90 = np.nanpercentile(sentiment[start:end], [10, 50, 90])
+        rank_bins.append({
+            "start": int(start), "end": int(end),
+            "satisfaction_mean": json_number(np.nanmean(satisfaction[start:end])),
+            "sentiment_p10": json_number(p10),
+            "sentiment_p50": json_number(p50),
+            "sentiment_p90": json_number(p90)
+        })
+
+    hist_edges = np.linspace(1, 5, 17)
+    satisfaction_counts, _ = np.histogram(satisfaction[~np.isnan(satisfaction)], bins=hist_edges)
+    sentiment_counts, _ = np.histogram(sentiment[~np.isnan(sentiment)], bins=hist_edges)
+
+    # 等距抽樣散點，保留整體分佈形狀
+    step = max(1, int(np.ceil(n / max_points)))
+    sample_index = np.arange(0, n, step)
+
+    return {
+        "count": n,
+        "avg_satisfaction": json_number(np.nanmean(satisfaction)),
+        "avg_sentiment": json_number(np.nanmean(sentiment)),
+        "rank_bins": rank_bins,
+        "histogram": {
+            "edges": [round(float(e), 3) for e in hist_edges],
+            "satisfaction": satisfaction_counts.tolist(),
+            "sentiment": sentiment_counts.tolist()
+        },
+        "scatter": {
+            "x": sample_index.tolist(),
+            "y": [json_number(v) for v in sentiment[sample_index]]
+        }
+    }
+
+def plot_large_satisfaction_trend(dept_id, aggregates):
+    """大量資料模式：上圖為排名分箱的滿意度與情緒區間，下圖為兩種評分的直方圖。"""
+    fig = Figure(figsize=(14, 10))
+    ax, ax_hist = fig.subplots(2, 1, gridspec_kw={"height_ratios": [3, 2]})
+    n = aggregates["count"]
+    bins = aggregates["rank_bins"]
+    starts = np.array([b["start"] for b in bins])
+    widths = np.array([b["end"] - b["start"] for b in bins])
+    centers = starts + widths / 2
+
+    # 彙總中的 null（整段缺值）轉回 NaN，繪圖時自動略過
+    ax.bar(starts, np.array([b["satisfaction_mean"] for b in bins], dtype=float), width=widths, align="edge",
+           alpha=0.6, color="blue", label="員工滿意度評分（分箱平均）")
+    ax.fill_between(centers, np.array([b["sentiment_p10"] for b in bins], dtype=float),
+                    np.array([b["sentiment_p90"] for b in bins], dtype=float),
+                    color="red", alpha=0.2, label="反饋情緒分析（P10~P90）")
+    ax.plot(centers, np.array([b["sentiment_p50"] for b in bins], dtype=float), color="red", linewidth=1.5, label="反饋情緒分析（中位數）")
+    ax.scatter(aggregates["scatter"]["x"], np.array(aggregates["scatter"]["y"], dtype=float), color="red", s=2, alpha=0.3, zorder=3)
+
+    avg_satisfaction = aggregates["avg_satisfaction"]
+    avg_sentiment = aggregates["avg_sentiment"]
+    ax.axhline(y=avg_satisfaction, color='orange', linestyle='--', label=f"滿意度平均 ({avg_satisfaction:.2f})")
+    ax.axhline(y=avg_sentiment, color='green', linestyle='--', label=f"情緒分析平均 ({avg_sentiment:.2f})")
+
+    # x 軸以排名百分位標示，取代逐一列出員工ID
+    percent_ticks = np.linspace(0, n, 11)
+    ax.set_xticks(percent_ticks)
+    ax.set_xticklabels([f"{int(p)}%" for p in np.linspace(0, 100, 11)])
+    ax.set_xlim(0, n)
+    ax.set_ylim(0, 5.5)
+    ax.set_xlabel(f"員工（依滿意度排名，共 {n} 人）")
+    ax.set_ylabel("評分")
+    ax.set_title(f"部門 {dept_id} 的員工滿意度與反饋情緒分析")
+    ax.grid(True, axis='y', linestyle='--', alpha=0.7)
+    ax.legend(loc="upper right")
+
+    edges = aggregates["histogram"]["edges"]
+    hist_width = (edges[1] - edges[0]) * 0.4
+    ax_hist.bar(np.array(edges[:-1]), aggregates["histogram"]["satisfaction"], width=hist_width, align="edge",
+                color="blue", alpha=0.6, label="員工滿意度評分")
+    ax_hist.bar(np.array(edges[:-1]) + hist_width, aggregates["histogram"]["sentiment"], width=hist_width, align="edge",
+                color="red", alpha=0.6, label="反饋情緒分析")
+    ax_hist.set_xlabel("評分")
+    ax_hist.set_ylabel("人數")
+    ax_hist.legend()
+    fig.tight_layout()
+    return fig
+
+def generate_satisfaction_trend_plot(dept_id, employee_data, large_n_threshold=LARGE_N_THRESHOLD, output_key=None):
+    # dept_id 用於圖表標題；output_key（預設同 dept_id）用於輸出檔名
+    output_key = output_key or dept_id
+    output_dir = SATISFACTION_TREND_DIR
     os.makedirs(output_dir, exist_ok=True)
     
     # 確保員工ID是字串型態
@@ -17,8 +139,9 @@ def generate_satisfaction_trend_plot(dept_id, employee_data):
     # 轉換滿意度評分為數字
     employee_data["員工滿意度評分"] = pd.to_numeric(employee_data["員工滿意度評分"], errors="coerce")
     
-    # 用 snownlp 對反饋內容進行情緒分析，映射至 1~5（與滿意度評分同尺度）
-    employee_data["反饋情緒分析"] = employee_data["近期反饋內容"].apply(lambda text: SnowNLP(text).sentiments * 4 + 1)
+    # 已有情緒分數（例如由 dashboard 預先算好）時直接沿用
+    if "反饋情緒分析" not in employee_data.columns:
+        employee_data["反饋情緒分析"] = sentiment_scores(employee_data["近期反饋內容"])
     
     # 計算兩者平均
     avg_satisfaction = employee_data["員工滿意度評分"].mean()
@@ -27,40 +150,53 @@ def generate_satisfaction_trend_plot(dept_id, employee_data):
     # 創建資料框來排序顯示
     plot_data = employee_data.sort_values("員工滿意度評分", ascending=False)
     
-    plt.figure(figsize=(14, 7))
+    # 彙總結果另存為精簡 JSON，供前端自行繪圖
+    aggregates = compute_satisfaction_aggregates(plot_data)
+    aggregates["large"] = len(plot_data) > large_n_threshold
+    with open(aggregates_path(output_key), "w", encoding="utf-8") as f:
+        json.dump(aggregates, f, ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+    
+    output_path = os.path.join(output_dir, f"satisfaction_trend_{output_key}.png")
+    if aggregates["large"]:
+        fig = plot_large_satisfaction_trend(dept_id, aggregates)
+        fig.savefig(output_path)
+        return output_path
+    
+    # 以 Figure 物件繪製（不經過 pyplot 的全域狀態），可與其他圖表在不同執行緒同時繪製
+    fig = Figure(figsize=(14, 7))
+    ax = fig.subplots()
     
     # 長條圖與散點圖
     x = range(len(plot_data))
-    plt.bar(x, plot_data["員工滿意度評分"], alpha=0.6, color="blue", label="員工滿意度評分")
-    plt.scatter(x, plot_data["反饋情緒分析"], color="red", label="反饋情緒分析", s=50, zorder=3)
+    ax.bar(x, plot_data["員工滿意度評分"], alpha=0.6, color="blue", label="員工滿意度評分")
+    ax.scatter(x, plot_data["反饋情緒分析"], color="red", label="反饋情緒分析", s=50, zorder=3)
     
     # 添加平均線
-    plt.axhline(y=avg_satisfaction, color='orange', linestyle='--', label=f"滿意度平均 ({avg_satisfaction:.2f})")
-    plt.axhline(y=avg_sentiment, color='green', linestyle='--', label=f"情緒分析平均 ({avg_sentiment:.2f})")
+    ax.axhline(y=avg_satisfaction, color='orange', linestyle='--', label=f"滿意度平均 ({avg_satisfaction:.2f})")
+    ax.axhline(y=avg_sentiment, color='green', linestyle='--', label=f"情緒分析平均 ({avg_sentiment:.2f})")
     
     # 設置圖表
-    plt.xlabel("員工")
-    plt.ylabel("評分")
-    plt.title(f"部門 {dept_id} 的員工滿意度與反饋情緒分析")
+    ax.set_xlabel("員工")
+    ax.set_ylabel("評分")
+    ax.set_title(f"部門 {dept_id} 的員工滿意度與反饋情緒分析")
     
     # 設置x軸標籤（每隔5個員工顯示一個ID）
     sparse_indices = range(0, len(plot_data), 5)
     sparse_labels = [plot_data["員工ID"].iloc[i] for i in sparse_indices]
-    plt.xticks([i for i in sparse_indices], sparse_labels, rotation=45)
+    ax.set_xticks([i for i in sparse_indices])
+    ax.set_xticklabels(sparse_labels, rotation=45)
     
-    plt.grid(True, axis='y', linestyle='--', alpha=0.7)
-    plt.legend()
-    plt.tight_layout()
-    plt.ylim(0, 5.5)
+    ax.grid(True, axis='y', linestyle='--', alpha=0.7)
+    ax.legend()
+    fig.tight_layout()
+    ax.set_ylim(0, 5.5)
     
     # 設置次要y軸來顯示滿意度等級
-    ax2 = plt.gca().twinx()
+    ax2 = ax.twinx()
     ax2.set_ylim(0, 5.5)
     ax2.set_yticks([1, 2, 3, 4, 5])
     ax2.set_yticklabels(['極不滿意', '不滿意', '中等', '滿意', '極滿意'])
     ax2.set_ylabel('滿意度等級')
     
-    output_path = os.path.join(output_dir, f"satisfaction_trend_{dept_id}.png")
-    plt.savefig(output_path)
-    plt.close()
+    fig.savefig(output_path)
     return output_path
\ No newline at end of file
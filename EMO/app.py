@@ -1,24 +1,32 @@
 import os
-import asyncio
+import time
+import uuid
 import json
 import threading
-import pandas as pd
 from dotenv import load_dotenv, find_dotenv
-from flask import Flask, render_template, request
-from flask_socketio import SocketIO, emit
+from flask import Flask, render_template, request, jsonify, send_file
+from flask_socketio import SocketIO, emit, join_room
 from werkzeug.utils import secure_filename
 from google import genai
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.teams import RoundRobinGroupChat
 from autogen_agentchat.messages import TextMessage
-from EMPwithSnow import generate_satisfaction_trend_plot
+from job_store import JobStore
+from worker import SOCKETIO_MESSAGE_QUEUE, run_worker
+from EMPwithSnow import aggregates_path
 
 # ✅ 初始化 Flask 與 SocketIO
+#    設定 SOCKETIO_MESSAGE_QUEUE 後，多個前端節點與分析節點透過訊息佇列互傳事件
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
-socketio = SocketIO(app, async_mode='threading')
+app.config['UPLOAD_FOLDER'] = os.getenv("EMO_UPLOAD_FOLDER", "uploads")
+socketio = SocketIO(app, async_mode='threading', message_queue=SOCKETIO_MESSAGE_QUEUE)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# ✅ 共用工作佇列；EMO_INLINE_WORKER=0 時本節點只當前端，分析交給獨立的 worker.py
+job_store = JobStore()
+INLINE_WORKER = os.getenv("EMO_INLINE_WORKER", "1") != "0"
+EVENT_RELAY_INTERVAL = 0.5
+
 # ✅ 載入 .env 並初始化 Gemini
 dotenv_path = find_dotenv()
 #print(f"✅ 目前使用的 .env 路徑: {dotenv_path}")
@@ -58,14 +66,18 @@ class GeminiChatCompletionClient:
 
 model_client = GeminiChatCompletionClient()
 
-# ✅ 多 Agent 分析（保留原來程式碼）
-from multiagent import run_multiagent_analysis
-
 # ✅ Flask 路由
 @app.route('/')
 def index():
     return render_template('index.html')
 
+# ✅ 瀏覽器連線後加入自己的 room，分析進度只送給上傳者
+@socketio.on('join')
+def handle_join(data):
+    client_id = (data or {}).get('client_id')
+    if client_id:
+        join_room(client_id)
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -75,58 +87,68 @@ def upload_file():
         return 'No selected file', 400
     if file:
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        # 每個工作使用獨立目錄，避免不同使用者上傳同名檔案互相覆蓋
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(app.config['UPLOAD_FOLDER'], job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        file_path = os.path.join(job_dir, filename)
         file.save(file_path)
-        socketio.emit('update', {'message': '🟢 檔案上傳成功，開始分析中...'})
-        threading.Thread(target=background_task, args=(file_path,)).start()
-        return 'File uploaded and processing started.', 200
-
-def background_task(file_path):
-    try:
-        # 確保CSV檔案結構正確
-        df = pd.read_csv(file_path)
-        
-        # 檢查必要欄位是否存在
-        required_columns = ["員工ID", "員工滿意度評分", "近期反饋內容"]
-        for col in required_columns:
-            if col not in df.columns:
-                raise ValueError(f"缺少必要欄位: {col}")
-        
-        # 處理數據，確保格式正確
-        df["員工ID"] = df["員工ID"].astype(str)
-        df["員工滿意度評分"] = pd.to_numeric(df["員工滿意度評分"], errors="coerce")
-        
-        # 處理可能的缺失值
-        if df["員工滿意度評分"].isna().any():
-            df = df.dropna(subset=["員工滿意度評分"])
-            socketio.emit('update', {'message': "⚠️ 警告: 有些記錄的滿意度評分無效，已自動過濾"})
-        
-        if len(df) == 0:
-            raise ValueError("處理後沒有有效數據可分析")
-            
-        dept_id = os.path.splitext(os.path.basename(file_path))[0]
-        
-        # 生成圖表
-        try:
-            plot_path = generate_satisfaction_trend_plot(dept_id, df)
-            socketio.emit('plot_generated', {'plot_url': '/' + plot_path})
-        except Exception as plot_error:
-            socketio.emit('update', {'message': f"⚠️ 生成圖表時出錯: {str(plot_error)}，但分析將繼續"})
-        
-        # 執行多Agent分析
-        asyncio.run(run_multiagent_analysis(socketio, dept_id, df))
-        
-    except ValueError as ve:
-        socketio.emit('update', {'message': f"❌ 數據驗證錯誤: {str(ve)}"})
-    except pd.errors.ParserError:
-        socketio.emit('update', {'message': "❌ CSV檔案格式錯誤，請確認檔案格式正確"})
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        socketio.emit('update', {'message': f"❌ 分析過程出現錯誤: {str(e)}"})
-        print(f"詳細錯誤: {error_details}")
+        room = request.form.get('client_id') or None
+        job_store.create_job(file_path, room, job_id=job_id)
+        socketio.emit('update', {'message': '🟢 檔案上傳成功，開始分析中...'}, to=room)
+        return jsonify({'job_id': job_id, 'message': 'File uploaded and processing started.'}), 200
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_store.get_job(job_id)
+    if job is None:
+        return 'Job not found', 404
+    return jsonify({key: job[key] for key in ('id', 'status', 'worker', 'error', 'attempts', 'heartbeat_at',
+                                              'created_at', 'updated_at')})
+
+# ✅ 滿意度圖表的彙總資料（精簡 JSON），供前端在大量資料時自行繪圖
+@app.route('/api/satisfaction_trend/<dept_id>')
+def satisfaction_trend_aggregates(dept_id):
+    path = aggregates_path(secure_filename(dept_id))
+    if not os.path.exists(path):
+        return 'Aggregates not found', 404
+    return send_file(os.path.abspath(path), mimetype='application/json', max_age=0)
+
+# ✅ 未使用訊息佇列時，從共用事件表取出分析節點寫入的事件，轉送給連在本節點的瀏覽器
+def relay_job_events():
+    last_id = job_store.last_event_id()
+    last_prune = time.time()
+    while True:
+        events = job_store.events_after(last_id)
+        for event in events:
+            socketio.emit(event['event'], event['payload'], to=event['room'])
+            last_id = event['id']
+        if time.time() - last_prune > 600:
+            job_store.prune_events()
+            last_prune = time.time()
+        if not events:
+            socketio.sleep(EVENT_RELAY_INTERVAL)
+
+_background_started = False
+_background_lock = threading.Lock()
+
+def start_background_services():
+    """啟動事件轉送與內建分析節點；重複呼叫只會啟動一次。"""
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    if not SOCKETIO_MESSAGE_QUEUE:
+        socketio.start_background_task(relay_job_events)
+    if INLINE_WORKER:
+        threading.Thread(target=run_worker, kwargs={'store': job_store}, daemon=True).start()
+
+# ✅ 匯入時即啟動背景服務，不論以 python app.py 或其他伺服器（如 gunicorn app:app）載入
+start_background_services()
 
 # 已移除 Gemini 聊天區支援即時回應功能
 
 if __name__ == '__main__':
-    socketio.run(app, debug=True)
\ No newline at end of file
+    # 關閉自動重新載入，避免監看用的父行程也啟動一組背景服務
+    socketio.run(app, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import matplotlib
+from matplotlib.figure import Figure
+from EMPwithSnow import generate_satisfaction_trend_plot, sentiment_scores, json_number, MAX_SCATTER_POINTS
+matplotlib.use('Agg')
+matplotlib.rc('font', family='Microsoft JhengHei')
+
+# ✅ 一次產生整組儀表板圖表：
+#    先計算所有圖表共用的彙總（情緒分數、分數分箱、每日與各部門統計），
+#    再以執行緒池平行繪製各圖，最後輸出一份 manifest 給前端載入。
+#    每張圖只拿到已彙總的小資料，不會重新讀檔或重新跑 SnowNLP；各圖以各自的 Figure 物件繪製，
+#    不經過 pyplot 的全域狀態，可以安全地在多個執行緒同時繪製，也不必另開子行程
+#    （從多執行緒的 Flask 行程 fork 可能死結）。
+
+STATIC_DIR = "static"
+# 沒有日期欄位時，趨勢圖依員工順序分段平均，最多顯示的點數
+MAX_TREND_POINTS = 200
+
+
+def manifest_path(dept_id):
+    return os.path.join(STATIC_DIR, "dashboard", f"manifest_{dept_id}.json")
+
+
+def chart_paths(dept_id):
+    """沿用 static/ 既有的圖表路徑命名。"""
+    return {
+        "satisfaction_trend": os.path.join(STATIC_DIR, "satisfactiontrend", f"satisfaction_trend_{dept_id}.png"),
+        "satisfaction_distribution": os.path.join(STATIC_DIR, "feedback_charts", f"satisfaction_distribution_{dept_id}.png"),
+        "sentiment_distribution": os.path.join(STATIC_DIR, "feedback_charts", f"sentiment_distribution_{dept_id}.png"),
+        "satisfaction_vs_sentiment": os.path.join(STATIC_DIR, "feedback_charts", f"satisfaction_vs_sentiment_{dept_id}.png"),
+        "feedback_trend": os.path.join(STATIC_DIR, "feedbacktrend", dept_id, "feedback_trend.png"),
+        "analysis_score_hist": os.path.join(STATIC_DIR, "moodtrend", f"analysis_score_hist_{dept_id}.png"),
+        "department_summary": os.path.join(STATIC_DIR, "dashboard", f"department_summary_{dept_id}.png"),
+    }
+
+
+def compute_dashboard_aggregates(employee_data):
+    """
+    計算所有圖表共用的彙總，回傳 (加上分數欄位的資料, 可序列化為 JSON 的彙總 dict)。
+    SnowNLP 情緒分數（0~1）沿用 EMPwithSnow.sentiment_scores，每種反饋只算一次；分析分數為映射到 1~10 的整數。
+    缺值的統計在彙總中為 null。
+    """
+    df = employee_data.copy()
+    df["員工ID"] = df["員工ID"].astype(str)
+    df["員工滿意度評分"] = pd.to_numeric(df["員工滿意度評分"], errors="coerce")
+
+    # 與滿意度同尺度（1~5），供滿意度趨勢圖使用；換回 0~1 即為 SnowNLP 原始分數
+    df["反饋情緒分析"] = sentiment_scores(df["近期反饋內容"])
+    df["情緒分數"] = (df["反饋情緒分析"] - 1) / 4
+    df["分析分數"] = np.clip(np.rint(df["情緒分數"] * 9 + 1), 1, 10).astype(int)
+
+    satisfaction_levels = df["員工滿意度評分"].round().clip(1, 5)
+    sentiment_counts, sentiment_edges = np.histogram(df["情緒分數"], bins=10, range=(0, 1))
+
+    # 散點只保留等距抽樣，另附各滿意度等級的平均情緒
+    step = max(1, int(np.ceil(len(df) / MAX_SCATTER_POINTS)))
+    sample = df.iloc[::step]
+
+    aggregates = {
+        "count": int(len(df)),
+        "avg_satisfaction": json_number(df["員工滿意度評分"].mean()),
+        "avg_sentiment": json_number(df["情緒分數"].mean()),
+        "avg_analysis_score": json_number(df["分析分數"].mean()),
+        "satisfaction_counts": {str(level): int((satisfaction_levels == level).sum()) for level in range(1, 6)},
+        "sentiment_histogram": {
+            "edges": [round(float(e), 2) for e in sentiment_edges],
+            "counts": sentiment_counts.tolist()
+        },
+        "analysis_score_counts": {str(score): int((df["分析分數"] == score).sum()) for score in range(1, 11)},
+        "satisfaction_vs_sentiment": {
+            "x": [json_number(v) for v in sample["員工滿意度評分"]],
+            "y": [json_number(v) for v in sample["情緒分數"]],
+            "level_means": {
+                str(int(level)): json_number(group.mean())
+                for level, group in df["情緒分數"].groupby(satisfaction_levels)
+            }
+        },
+        "trend": _trend_rollup(df),
+        "departments": _department_rollup(df),
+    }
+    return df, aggregates
+
+
+def _trend_rollup(df):
+    """有「日期」欄位時依日期彙總；否則依員工順序（資料量大時分段平均）。"""
+    if "日期" in df.columns:
+        dates = pd.to_datetime(df["日期"], errors="coerce")
+        grouped = df.assign(日期=dates.dt.strftime("%Y-%m-%d")).dropna(subset=["日期"]).groupby("日期")
+        rollup = grouped.agg(satisfaction=("員工滿意度評分", "mean"), analysis_score=("分析分數", "mean"),
+                             count=("員工ID", "size")).reset_index()
+        return {
+            "by": "date",
+            "labels": rollup["日期"].tolist(),
+            "satisfaction": [json_number(v) for v in rollup["satisfaction"]],
+            "analysis_score": [json_number(v) for v in rollup["analysis_score"]],
+            "count": rollup["count"].astype(int).tolist()
+        }
+
+    segments = np.array_split(np.arange(len(df)), min(len(df), MAX_TREND_POINTS)) if len(df) else []
+    ids = df["員工ID"].tolist()
+    labels, satisfaction, analysis_score, count = [], [], [], []
+    for seg in segments:
+        part = df.iloc[seg]
+        labels.append(ids[seg[0]] if len(seg) == 1 else f"{ids[seg[0]]}~{ids[seg[-1]]}")
+        satisfaction.append(json_number(part["員工滿意度評分"].mean()))
+        analysis_score.append(json_number(part["分析分數"].mean()))
+        count.append(int(len(seg)))
+    return {"by": "employee", "labels": labels, "satisfaction": satisfaction,
+            "analysis_score": analysis_score, "count": count}
+
+
+def _department_rollup(df):
+    if "部門" not in df.columns:
+        return []
+    rollup = df.groupby("部門").agg(count=("員工ID", "size"), satisfaction=("員工滿意度評分", "mean"),
+                                    sentiment=("情緒分數", "mean")).reset_index()
+    return [
+        {"department": str(r["部門"]), "count": int(r["count"]),
+         "satisfaction": json_number(r["satisfaction"]), "sentiment": json_number(r["sentiment"])}
+        for _, r in rollup.iterrows()
+    ]
+
+
+# ✅ 各圖表繪製函式：只使用彙總資料，以 Figure 物件繪製（不經過 pyplot 的全域狀態）
+def _values(values):
+    # 彙總中的 null 轉回 NaN，繪圖時自動略過
+    return np.array(values, dtype=float)
+
+
+def _save(fig, output_path):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    fig.tight_layout()
+    fig.savefig(output_path)
+    return output_path
+
+
+def render_satisfaction_distribution(dept_id, agg, output_path):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    levels = list(agg["satisfaction_counts"].keys())
+    ax.bar(levels, list(agg["satisfaction_counts"].values()), color="#3498db")
+    ax.set_title(f"報告 {dept_id}：員工滿意度評分分佈")
+    ax.set_xlabel("員工自評滿意度評分 (1-5)")
+    ax.set_ylabel("人數")
+    ax.grid(True, axis="y", linestyle="--", alpha=0.7)
+    return _save(fig, output_path)
+
+
+def render_sentiment_distribution(dept_id, agg, output_path):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    edges = agg["sentiment_histogram"]["edges"]
+    ax.bar(edges[:-1], agg["sentiment_histogram"]["counts"], width=edges[1] - edges[0], align="edge",
+           color="#e74c3c", alpha=0.7, edgecolor="white")
+    ax.set_title(f"報告 {dept_id}：SnowNLP 情緒分數分佈")
+    ax.set_xlabel("SnowNLP 情緒分數 (0-1)")
+    ax.set_ylabel("人數")
+    ax.grid(True, axis="y", linestyle="--", alpha=0.7)
+    return _save(fig, output_path)
+
+
+def render_satisfaction_vs_sentiment(dept_id, agg, output_path):
+    fig = Figure(figsize=(10, 7))
+    ax = fig.subplots()
+    points = agg["satisfaction_vs_sentiment"]
+    ax.scatter(_values(points["x"]), _values(points["y"]), alpha=0.6, s=30)
+    means = points["level_means"]
+    ax.plot([float(k) for k in means], _values(list(means.values())), color="orange", marker="o", label="各評分平均情緒")
+    ax.set_title(f"報告 {dept_id}：員工自評分數 vs SnowNLP 情緒分數關係")
+    ax.set_xlabel("員工自評滿意度評分 (1-5)")
+    ax.set_ylabel("SnowNLP 情緒分數 (0-1)")
+    ax.grid(True, linestyle="--")
+    ax.legend()
+    return _save(fig, output_path)
+
+
+def render_feedback_trend(dept_id, agg, output_path):
+    fig = Figure(figsize=(14, 7))
+    ax = fig.subplots()
+    trend = agg["trend"]
+    x = range(len(trend["labels"]))
+    # 滿意度 1~5 換算到 1~10，與分析分數同尺度
+    ax.plot(x, _values(trend["satisfaction"]) * 2, color="blue", marker="o", label="滿意度紀錄")
+    ax.plot(x, _values(trend["analysis_score"]), color="red", marker="o", label="SnowNLP 分析分數")
+    if agg["avg_satisfaction"] is not None:
+        ax.axhline(y=agg["avg_satisfaction"] * 2, color="orange", linestyle="--", label=f"紀錄平均 ({agg['avg_satisfaction'] * 2:.2f})")
+    if agg["avg_analysis_score"] is not None:
+        ax.axhline(y=agg["avg_analysis_score"], color="green", linestyle="--", label=f"分析平均 ({agg['avg_analysis_score']:.2f})")
+    step = max(1, len(trend["labels"]) // 50)
+    ax.set_xticks(list(x)[::step])
+    ax.set_xticklabels(trend["labels"][::step], rotation=90)
+    ax.set_title("員工滿意度與反饋情緒分析趨勢圖")
+    ax.set_xlabel("日期" if trend["by"] == "date" else "員工ID")
+    ax.set_ylabel("滿意度指數 (1~10)")
+    ax.grid(True)
+    ax.legend()
+    return _save(fig, output_path)
+
+
+def render_analysis_score_hist(dept_id, agg, output_path):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    scores = list(agg["analysis_score_counts"].keys())
+    colors = matplotlib.colormaps["YlOrBr"](np.linspace(0.15, 0.95, len(scores)))
+    ax.bar(scores, list(agg["analysis_score_counts"].values()), color=colors)
+    ax.set_title(f"員工 {dept_id} 的分析分數分佈圖")
+    ax.set_xlabel("分析分數 (1~10)")
+    ax.set_ylabel("人數")
+    ax.grid(True, axis="y")
+    return _save(fig, output_path)
+
+
+def render_department_summary(dept_id, agg, output_path):
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    departments = agg["departments"]
+    x = np.arange(len(departments))
+    ax.bar(x - 0.2, _values([d["satisfaction"] for d in departments]), width=0.4, color="#3498db", label="平均滿意度 (1-5)")
+    ax.bar(x + 0.2, _values([d["sentiment"] for d in departments]) * 4 + 1, width=0.4, color="#e74c3c", label="平均情緒 (換算 1-5)")
+    ax.set_xticks(x)
+    ax.set_xticklabels([f"{d['department']}\n({d['count']} 人)" for d in departments])
+    ax.set_ylim(0, 5.5)
+    ax.set_title(f"報告 {dept_id}：各部門滿意度與情緒")
+    ax.grid(True, axis="y", linestyle="--", alpha=0.7)
+    ax.legend()
+    return _save(fig, output_path)
+
+
+CHARTS = [
+    ("satisfaction_distribution", "滿意度分佈", render_satisfaction_distribution),
+    ("sentiment_distribution", "情緒分數分佈", render_sentiment_distribution),
+    ("satisfaction_vs_sentiment", "滿意度與情緒關係", render_satisfaction_vs_sentiment),
+    ("feedback_trend", "反饋趨勢", render_feedback_trend),
+    ("analysis_score_hist", "分析分數分佈", render_analysis_score_hist),
+    ("department_summary", "各部門摘要", render_department_summary),
+]
+
+
+def generate_dashboard(dept_id, employee_data, output_key=None):
+    """
+    計算共用彙總、繪製整組圖表，寫出 manifest 並回傳其內容。
+    dept_id 用於圖表標題；output_key（預設同 dept_id）用於輸出檔名，例如分析工作的代號。
+    """
+    start = time.time()
+    output_key = output_key or dept_id
+    df, aggregates = compute_dashboard_aggregates(employee_data)
+    paths = chart_paths(output_key)
+
+    charts = [(name, title, render) for name, title, render in CHARTS
+              if name != "department_summary" or len(aggregates["departments"]) > 1]
+    # 滿意度趨勢圖沿用 EMPwithSnow，傳入已算好的情緒分數避免重算
+    trend_columns = df[["員工ID", "員工滿意度評分", "近期反饋內容", "反饋情緒分析"]].copy()
+    jobs = [("satisfaction_trend", "滿意度與情緒分析",
+             lambda: generate_satisfaction_trend_plot(dept_id, trend_columns, output_key=output_key))]
+    jobs += [(name, title, lambda render=render, name=name: render(dept_id, aggregates, paths[name]))
+             for name, title, render in charts]
+
+    # 各圖互不相依，以執行緒池同時繪製；manifest 仍依原本順序列出
+    manifest_charts = []
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = [(name, title, executor.submit(job)) for name, title, job in jobs]
+        for name, title, future in futures:
+            try:
+                manifest_charts.append({"name": name, "title": title, "url": "/" + future.result().replace(os.sep, "/")})
+            except Exception as e:
+                print(f"⚠️ 圖表 {name} 生成失敗: {e}")
+
+    manifest = {
+        "dept_id": dept_id,
+        "output_key": output_key,
+        "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "elapsed_seconds": round(time.time() - start, 2),
+        "charts": manifest_charts,
+        "aggregates": aggregates,
+    }
+    os.makedirs(os.path.dirname(manifest_path(output_key)), exist_ok=True)
+    with open(manifest_path(output_key), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+    return manifest
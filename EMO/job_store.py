@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+
+# 共用工作佇列（SQLite）
+# 前端節點上傳檔案後建立工作，分析節點（worker.py）從這裡領取工作；
+# 未設定 SOCKETIO_MESSAGE_QUEUE 時，分析進度事件也寫在這裡，由各前端節點轉送給瀏覽器。
+# 多台機器部署時，JOB_DB_PATH 與 uploads/、static/ 需放在共用儲存空間。
+# 執行中的工作由 worker 定期更新 heartbeat_at；超過租約時間沒有更新（worker 當掉或重啟）
+# 就重新排隊，重試 MAX_JOB_ATTEMPTS 次仍未完成則標記為失敗。
+
+JOB_DB_PATH = os.getenv("EMO_JOB_DB", "emo_jobs.db")
+JOB_LEASE_SECONDS = float(os.getenv("EMO_JOB_LEASE", "60"))
+MAX_JOB_ATTEMPTS = 3
+
+
+class JobStore:
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        # 每個執行緒各自開連線，避免跨執行緒共用 sqlite 連線
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                file_path TEXT,
+                room TEXT,
+                status TEXT,
+                worker TEXT,
+                error TEXT,
+                attempts INTEGER DEFAULT 0,
+                heartbeat_at REAL,
+                created_at REAL,
+                updated_at REAL
+            )
+        """)
+        # 舊版資料庫補上租約相關欄位
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "attempts" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER DEFAULT 0")
+        if "heartbeat_at" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT,
+                room TEXT,
+                event TEXT,
+                payload TEXT,
+                created_at REAL
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create_job(self, file_path, room, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, file_path, room, status, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, file_path, room, now, now)
+            )
+        finally:
+            conn.close()
+        return job_id
+
+    def _requeue_stale(self, conn, lease_seconds):
+        """租約過期的執行中工作重新排隊；已達重試上限的標記為失敗。回傳重新排隊的筆數。"""
+        now = time.time()
+        expired = now - lease_seconds
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, worker = NULL, updated_at = ? "
+            "WHERE status = 'running' AND COALESCE(heartbeat_at, updated_at) < ? AND attempts >= ?",
+            (f"分析節點逾時未回應，已重試 {MAX_JOB_ATTEMPTS} 次", now, expired, MAX_JOB_ATTEMPTS)
+        )
+        return conn.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL, updated_at = ? "
+            "WHERE status = 'running' AND COALESCE(heartbeat_at, updated_at) < ?",
+            (now, expired)
+        ).rowcount
+
+    def claim_job(self, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        """原子性地領取最早排隊的工作（先回收租約過期的工作）；沒有工作時回傳 None。"""
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE 先取得寫入鎖，確保同一工作只會被一個 worker 領走
+            conn.execute("BEGIN IMMEDIATE")
+            self._requeue_stale(conn, lease_seconds)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, heartbeat_at = ?, "
+                "updated_at = ? WHERE id = ?",
+                (worker_id, now, now, row["id"])
+            )
+            conn.execute("COMMIT")
+            return dict(row, status="running", worker=worker_id, attempts=row["attempts"] + 1, heartbeat_at=now)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id, worker_id):
+        """延長租約；工作已被重新排隊給其他 worker 時回傳 False。"""
+        conn = self._connect()
+        try:
+            now = time.time()
+            return conn.execute(
+                "UPDATE jobs SET heartbeat_at = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (now, now, job_id, worker_id)
+            ).rowcount == 1
+        finally:
+            conn.close()
+
+    def finish_job(self, job_id, error=None, worker_id=None):
+        """標記完成或失敗；指定 worker_id 時，只有仍持有該工作的 worker 能更新。"""
+        conn = self._connect()
+        try:
+            sql = "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?"
+            params = ["failed" if error else "done", error, time.time(), job_id]
+            if worker_id is not None:
+                sql += " AND worker = ?"
+                params.append(worker_id)
+            conn.execute(sql, params)
+        finally:
+            conn.close()
+
+    def get_job(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def publish_event(self, job_id, room, event, payload):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO events (job_id, room, event, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, room, event, json.dumps(payload, ensure_ascii=False), time.time())
+            )
+        finally:
+            conn.close()
+
+    def last_event_id(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        finally:
+            conn.close()
+
+    def events_after(self, last_id, limit=500):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, room, event, payload FROM events WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+            ).fetchall()
+            return [{"id": r["id"], "room": r["room"], "event": r["event"], "payload": json.loads(r["payload"])} for r in rows]
+        finally:
+            conn.close()
+
+    def prune_events(self, max_age=3600):
+        """刪除已轉送過一段時間的舊事件。"""
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM events WHERE created_at < ?", (time.time() - max_age,))
+        finally:
+            conn.close()
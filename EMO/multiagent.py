@@ -1,4 +1,5 @@
 import os
+import sys
 import asyncio
 import json
 import time
@@ -9,6 +10,11 @@ from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.teams import RoundRobinGroupChat
 from autogen_agentchat.messages import TextMessage
 
+# 共用模組（模型呼叫韌性層等）放在專案根目錄
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_resilience import ResilientCaller
+from model_router import model_router
+
 # ✅ 載入 .env 並啟用 Gemini 原生用法
 dotenv_path = find_dotenv()
 print(f"✅ 目前使用的 .env 路徑: {dotenv_path}")
@@ -20,9 +26,13 @@ print(GEMINI_API_KEY)
 # ✅ 使用 Gemini 原生 client
 client = genai.Client(api_key=GEMINI_API_KEY)
 
+# ✅ 模型呼叫：暫時性錯誤自動重試、API 故障時斷路；慢回應對沖會重複計費，設定 LLM_HEDGE=1 才開啟（快速失敗）
+gemini_caller = ResilientCaller()
+
 # ✅ 封裝成符合 autogen agentchat 的結構
 class GeminiChatCompletionClient:
-    def __init__(self, model="gemini-1.5-flash-8b"):
+    def __init__(self, model=None):
+        # 未指定模型時，每次呼叫都依路由政策選擇多代理人綜合分析的模型並記錄延遲
         self.model = model
         self.model_info = {"vision": False}  # ✅ 避免 autogen 出錯
 
@@ -34,10 +44,14 @@ class GeminiChatCompletionClient:
             elif isinstance(m, dict) and 'content' in m:
                 parts.append(str(m['content']))
         content = "\n".join(parts)
-        response = client.models.generate_content(
-            model=self.model,
-            contents=content
-        )
+        if self.model:
+            response = gemini_caller.call(client.models.generate_content, model=self.model, contents=content)
+        else:
+            response = model_router.call(
+                "multi_agent_synthesis",
+                lambda model_name: gemini_caller.call(client.models.generate_content, model=model_name, contents=content),
+                caller=gemini_caller
+            )
         #print("📨 Gemini 回應內容：", response)
         return type("Response", (), {
             "text": response.text,
@@ -105,9 +119,10 @@ async def interactive_two_agent_analysis(socketio: SocketIO, dept_id, employee_d
     
     # 第一個 Agent（HR 分析專家）生成分析
     try:
-        response1 = client.models.generate_content(
-            model="gemini-1.5-flash-8b",
-            contents=analyst_prompt
+        response1 = model_router.call(
+            "multi_agent_synthesis",
+            lambda model_name: gemini_caller.call(client.models.generate_content, model=model_name, contents=analyst_prompt),
+            caller=gemini_caller
         )
         
         analysis = response1.text.strip()
@@ -151,9 +166,10 @@ async def interactive_two_agent_analysis(socketio: SocketIO, dept_id, employee_d
         await asyncio.sleep(1.5)
         
         # 第二個 Agent（HR 顧問）生成建議
-        response2 = client.models.generate_content(
-            model="gemini-1.5-flash-8b", 
-            contents=consultant_prompt
+        response2 = model_router.call(
+            "multi_agent_synthesis",
+            lambda model_name: gemini_caller.call(client.models.generate_content, model=model_name, contents=consultant_prompt),
+            caller=gemini_caller
         )
         
         recommendations = response2.text.strip()
@@ -184,9 +200,10 @@ async def interactive_two_agent_analysis(socketio: SocketIO, dept_id, employee_d
             建議：{recommendations}
             """
             
-            summary_response = client.models.generate_content(
-                model="gemini-1.5-flash-8b",
-                contents=summary_prompt
+            summary_response = model_router.call(
+                "multi_agent_synthesis",
+                lambda model_name: gemini_caller.call(client.models.generate_content, model=model_name, contents=summary_prompt),
+                caller=gemini_caller
             )
             
             summary = summary_response.text.strip()
@@ -207,6 +224,8 @@ async def run_multiagent_analysis(socketio: SocketIO, dept_id, employee_data):
     try:
         # 使用兩個互動式 Agent 進行分析
         await interactive_two_agent_analysis(socketio, dept_id, employee_data)
+        print(f"📊 {gemini_caller.report()}")
+        print(f"📊 模型路由：{model_router.report()}")
     except Exception as e:
         socketio.emit('update', {
             'message': f'❌ 分析過程出現未預期錯誤: {str(e)}',
@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+import socket
+import asyncio
+import threading
+import traceback
+import pandas as pd
+from flask_socketio import SocketIO
+from EMPwithSnow import LARGE_N_THRESHOLD
+from dashboard import generate_dashboard, manifest_path
+from multiagent import run_multiagent_analysis
+from job_store import JobStore, JOB_LEASE_SECONDS
+
+# ✅ 分析節點：從共用工作佇列領取上傳的 CSV，執行圖表與多 Agent 分析，
+#    進度事件送回上傳者所在的瀏覽器（room），不論該瀏覽器連在哪一台前端節點。
+#    用法：python worker.py（可在多台機器 / 多個行程同時執行）
+
+# 設定後改用 Flask-SocketIO 的訊息佇列（例如 redis://localhost:6379/0）傳遞事件；
+# 未設定時以共用的 SQLite 事件表代替，由前端節點轉送
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+POLL_INTERVAL = 1.0
+# 處理工作期間定期更新租約，間隔需遠小於 JOB_LEASE_SECONDS
+HEARTBEAT_INTERVAL = JOB_LEASE_SECONDS / 4
+
+
+# ✅ 與 socketio.emit 介面相同，讓 multiagent 不需知道事件如何送達
+class JobEmitter:
+    def __init__(self, store, job, external_socketio=None):
+        self.store = store
+        self.job_id = job["id"]
+        self.room = job["room"]
+        self.external_socketio = external_socketio
+
+    def emit(self, event, data):
+        if self.external_socketio is not None:
+            self.external_socketio.emit(event, data, to=self.room)
+        else:
+            self.store.publish_event(self.job_id, self.room, event, data)
+
+
+def process_job(job, socketio):
+    """執行單一工作；成功回傳 None，失敗回傳錯誤訊息。"""
+    file_path = job["file_path"]
+    try:
+        # 確保CSV檔案結構正確
+        df = pd.read_csv(file_path)
+
+        # 檢查必要欄位是否存在
+        required_columns = ["員工ID", "員工滿意度評分", "近期反饋內容"]
+        for col in required_columns:
+            if col not in df.columns:
+                raise ValueError(f"缺少必要欄位: {col}")
+
+        # 處理數據，確保格式正確
+        df["員工ID"] = df["員工ID"].astype(str)
+        df["員工滿意度評分"] = pd.to_numeric(df["員工滿意度評分"], errors="coerce")
+
+        # 處理可能的缺失值
+        if df["員工滿意度評分"].isna().any():
+            df = df.dropna(subset=["員工滿意度評分"])
+            socketio.emit('update', {'message': "⚠️ 警告: 有些記錄的滿意度評分無效，已自動過濾"})
+
+        if len(df) == 0:
+            raise ValueError("處理後沒有有效數據可分析")
+
+        # dept_id 為顯示用名稱；輸出檔以工作代號命名，同名上傳的圖表與 manifest 不會互相覆蓋
+        dept_id = os.path.splitext(os.path.basename(file_path))[0]
+        output_key = job["id"]
+
+        # 一次生成整組儀表板圖表（共用彙總，只算一次情緒分數）
+        try:
+            manifest = generate_dashboard(dept_id, df, output_key=output_key)
+            charts = {chart['name']: chart['url'] for chart in manifest['charts']}
+            if 'satisfaction_trend' in charts:
+                socketio.emit('plot_generated', {
+                    'plot_url': charts['satisfaction_trend'],
+                    # 大量資料時前端可改用彙總 JSON 自行繪圖
+                    'aggregates_url': f'/api/satisfaction_trend/{output_key}',
+                    'large': len(df) > LARGE_N_THRESHOLD
+                })
+            socketio.emit('dashboard_generated', {'manifest_url': '/' + manifest_path(output_key).replace(os.sep, '/')})
+        except Exception as plot_error:
+            socketio.emit('update', {'message': f"⚠️ 生成圖表時出錯: {str(plot_error)}，但分析將繼續"})
+
+        # 執行多Agent分析
+        asyncio.run(run_multiagent_analysis(socketio, dept_id, df))
+        return None
+
+    except ValueError as ve:
+        socketio.emit('update', {'message': f"❌ 數據驗證錯誤: {str(ve)}"})
+        return str(ve)
+    except pd.errors.ParserError:
+        socketio.emit('update', {'message': "❌ CSV檔案格式錯誤，請確認檔案格式正確"})
+        return "CSV檔案格式錯誤"
+    except Exception as e:
+        error_details = traceback.format_exc()
+        socketio.emit('update', {'message': f"❌ 分析過程出現錯誤: {str(e)}"})
+        print(f"詳細錯誤: {error_details}")
+        return str(e)
+
+
+def keep_lease(store, job_id, worker_id, stop_event):
+    """在背景定期更新工作租約，直到 stop_event 被設定。"""
+    while not stop_event.wait(HEARTBEAT_INTERVAL):
+        if not store.heartbeat(job_id, worker_id):
+            print(f"⚠️ [{worker_id}] 工作 {job_id} 的租約已失效（已被重新排隊）")
+            return
+
+
+def run_worker(store=None, worker_id=None, external_socketio=None, stop_event=None):
+    """持續領取並處理工作，直到 stop_event 被設定。"""
+    store = store or JobStore()
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    if external_socketio is None and SOCKETIO_MESSAGE_QUEUE:
+        external_socketio = SocketIO(message_queue=SOCKETIO_MESSAGE_QUEUE)
+    print(f"✅ 分析節點 {worker_id} 已啟動")
+
+    while stop_event is None or not stop_event.is_set():
+        job = store.claim_job(worker_id)
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+        print(f"🔄 [{worker_id}] 處理工作 {job['id']}（第 {job['attempts']} 次）：{job['file_path']}")
+        lease_done = threading.Event()
+        threading.Thread(target=keep_lease, args=(store, job["id"], worker_id, lease_done), daemon=True).start()
+        try:
+            error = process_job(job, JobEmitter(store, job, external_socketio))
+        finally:
+            lease_done.set()
+        store.finish_job(job["id"], error, worker_id=worker_id)
+
+
+if __name__ == '__main__':
+    run_worker(worker_id=sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+
+# 離職風險本地評分（純 NumPy，完全離線）
+# 對壓力指數、遲到次數、請假天數、員工滿意度評分、年度績效評分打分，
+# 讓 LLM 只需要看高風險員工與整體分佈，不必自己做數值運算。
+#   - 以「是否申請過離職」為標籤訓練邏輯迴歸，權重方向限制在 PRIOR_DIRECTIONS（例如壓力越高風險不會越低）
+#   - 以交叉驗證 AUC 檢查模型；AUC 未達 MIN_CV_AUC（與亂猜差不多）時不使用擬合結果，
+#     改用固定方向的等權重評分，但該評分的 AUC 也須達 MIN_CV_AUC；兩者都不合格就不排序，提示改附原始數據
+#   - 已申請過離職的員工直接視為最高風險（1.0）
+
+FEATURES = ["壓力指數", "遲到次數", "請假天數", "員工滿意度評分", "年度績效評分"]
+LABEL = "是否申請過離職"
+# 各特徵對離職風險的方向：+1 越高風險越高，-1 越高風險越低
+PRIOR_DIRECTIONS = [1.0, 1.0, 1.0, -1.0, -1.0]
+MIN_CV_AUC = 0.6
+CV_FOLDS = 5
+# 提示中最多列出的已申請離職員工ID數
+MAX_APPLIED_IDS = 50
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "attrition_risk_model.json")
+
+
+def feature_matrix(df: pd.DataFrame, fill_values=None) -> np.ndarray:
+    """將特徵欄位轉成 float 矩陣；缺值以 fill_values（預設為欄位平均）補上。"""
+    X = np.column_stack([pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float) for col in FEATURES])
+    if fill_values is None:
+        fill_values = np.nanmean(X, axis=0)
+    missing = np.isnan(X)
+    if missing.any():
+        X[missing] = np.take(fill_values, np.nonzero(missing)[1])
+    return X
+
+
+def has_applied(df: pd.DataFrame) -> np.ndarray:
+    """是否申請過離職（沒有該欄位時全部視為否）。"""
+    if LABEL not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return (df[LABEL].astype(str).str.strip() == "是").to_numpy()
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+def auc_score(y: np.ndarray, scores: np.ndarray) -> float:
+    """ROC AUC（Mann-Whitney 排名法，同分取平均名次）。"""
+    positives = int(y.sum())
+    negatives = len(y) - positives
+    if positives == 0 or negatives == 0:
+        return float("nan")
+    ranks = pd.Series(scores).rank().to_numpy()
+    return float((ranks[y == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+def _fit(Z: np.ndarray, y: np.ndarray, epochs: int, learning_rate: float, l2: float):
+    """限制權重方向的邏輯迴歸（投影梯度下降：方向不符的權重歸零）。"""
+    directions = np.asarray(PRIOR_DIRECTIONS)
+    weights = np.zeros(Z.shape[1])
+    bias = 0.0
+    n = len(y)
+    for _ in range(epochs):
+        error = _sigmoid(Z @ weights + bias) - y
+        weights -= learning_rate * (Z.T @ error / n + l2 * weights)
+        weights = np.maximum(weights * directions, 0.0) * directions
+        bias -= learning_rate * error.mean()
+    return weights, bias
+
+
+def train_model(df: pd.DataFrame, epochs: int = 2000, learning_rate: float = 0.1, l2: float = 0.01) -> dict:
+    """
+    訓練並驗證離職風險模型，回傳可 JSON 序列化的模型。
+    交叉驗證 AUC >= MIN_CV_AUC 才採用擬合的權重（method = "fitted"）；
+    否則等權重評分的 AUC >= MIN_CV_AUC 時採用 PRIOR_DIRECTIONS 的等權重評分（method = "prior"），
+    此時分數只代表相對排序；兩者都不合格時不提供排序（method = "none"）。
+    """
+    X = feature_matrix(df)
+    y = has_applied(df).astype(float)
+
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1.0
+    Z = (X - mean) / std
+
+    # K 折交叉驗證：每折的驗證資料都不參與該折訓練
+    folds = np.array_split(np.random.default_rng(0).permutation(len(y)), CV_FOLDS)
+    held_out = np.empty(len(y))
+    for fold in folds:
+        train = np.setdiff1d(np.arange(len(y)), fold)
+        weights, bias = _fit(Z[train], y[train], epochs, learning_rate, l2)
+        held_out[fold] = Z[fold] @ weights + bias
+    cv_auc = auc_score(y, held_out)
+
+    prior_weights = np.asarray(PRIOR_DIRECTIONS) / len(FEATURES)
+    prior_auc = auc_score(y, Z @ prior_weights)
+
+    if cv_auc >= MIN_CV_AUC:
+        method = "fitted"
+        weights, bias = _fit(Z, y, epochs, learning_rate, l2)
+    elif prior_auc >= MIN_CV_AUC:
+        method = "prior"
+        weights, bias = prior_weights, 0.0
+    else:
+        method = "none"
+        weights, bias = np.zeros(len(FEATURES)), 0.0
+
+    return {
+        "features": FEATURES,
+        "method": method,
+        "mean": mean.tolist(),
+        "std": std.tolist(),
+        "weights": np.asarray(weights).tolist(),
+        "bias": float(bias),
+        "train_rows": int(len(y)),
+        "positive_rate": round(float(y.mean()), 4),
+        "cv_auc": round(cv_auc, 4),
+        "prior_auc": round(prior_auc, 4)
+    }
+
+
+def describe_model(model: dict) -> str:
+    """一句話說明評分方式與驗證結果（兩種 AUC 都列出），放進提示讓 LLM 知道分數可信度。"""
+    quality = (f"以「{LABEL}」驗證（{model['train_rows']} 筆）：邏輯迴歸交叉驗證 AUC {model['cv_auc']:.2f}，"
+               f"等權重指標 AUC {model['prior_auc']:.2f}（0.5 為隨機猜測，採用門檻 {MIN_CV_AUC}）")
+    if model.get("method") == "fitted":
+        return f"評分方式：邏輯迴歸模型。{quality}"
+    if model.get("method") == "prior":
+        return (f"評分方式：壓力、遲到、請假越高、滿意度與績效越低風險越高的等權重指標，分數僅代表相對高低。{quality}")
+    return f"未提供離職風險排序：兩種評分都未達採用門檻。{quality}"
+
+
+def save_model(model: dict, path: str = MODEL_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(model, f, ensure_ascii=False, indent=2)
+
+
+def load_model(path: str = MODEL_PATH) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_or_train(csv_file_path: str, path: str = MODEL_PATH) -> dict:
+    """有已訓練的模型就直接載入，否則用 csv_file_path 訓練並存檔。"""
+    if os.path.exists(path):
+        model = load_model(path)
+        # 舊版模型檔沒有驗證資訊，重新訓練
+        if "method" in model:
+            return model
+    model = train_model(pd.read_csv(csv_file_path))
+    save_model(model, path)
+    return model
+
+
+def score_matrix(model: dict, X: np.ndarray) -> np.ndarray:
+    """向量化計算離職風險分數（0~1）。"""
+    mean = np.asarray(model["mean"])
+    std = np.asarray(model["std"])
+    weights = np.asarray(model["weights"])
+    return _sigmoid(((X - mean) / std) @ weights + model["bias"])
+
+
+def score_employees(df: pd.DataFrame, model: dict) -> pd.Series:
+    """計算每位員工的離職風險；已申請過離職者直接設為 1.0，模型不合格（method = "none"）時其餘為 NaN。"""
+    X = feature_matrix(df, fill_values=np.asarray(model["mean"]))
+    scores = score_matrix(model, X) if model.get("method") != "none" else np.full(len(df), np.nan)
+    scores[has_applied(df)] = 1.0
+    return pd.Series(scores, index=df.index, name="離職風險")
+
+
+def risk_context(df: pd.DataFrame, scores: pd.Series, model: dict, top_k: int = 20) -> str:
+    """
+    組出提示用的文字：評分方式、已申請離職名單，加上風險分佈摘要與其餘員工中前 top_k 名高風險者。
+    模型不合格（method = "none"）時不排序，改附其餘員工的原始數據。
+    """
+    applied = has_applied(df)
+    values = scores.to_numpy()[~applied]
+    id_column = "員工ID" if "員工ID" in df.columns else None
+    applied_ids = df.loc[applied, id_column].astype(str).tolist() if id_column else df.index[applied].tolist()
+    header = (
+        f"{describe_model(model)}\n"
+        f"已申請過離職（風險視為最高 1.0）：{len(applied_ids)} 人："
+        f"{applied_ids[:MAX_APPLIED_IDS]}{' 等' if len(applied_ids) > MAX_APPLIED_IDS else ''}\n"
+    )
+
+    columns = ["員工ID", "部門", "職位"] + FEATURES
+    columns = [col for col in columns if col in df.columns]
+    if model.get("method") == "none":
+        return header + f"尚未申請離職的 {int((~applied).sum())} 位員工原始數據:\n{df.loc[~applied, columns].to_dict(orient='records')}"
+
+    if len(values):
+        quantiles = np.percentile(values, [25, 50, 75, 90])
+        counts, edges = np.histogram(values, bins=5, range=(0.0, 1.0))
+        histogram = "、".join(f"{edges[i]:.1f}~{edges[i + 1]:.1f}: {counts[i]} 人" for i in range(len(counts)))
+        distribution = (
+            f"尚未申請離職者的風險分佈（共 {len(values)} 人）：平均 {values.mean():.3f}，"
+            f"P25 {quantiles[0]:.3f}、P50 {quantiles[1]:.3f}、P75 {quantiles[2]:.3f}、P90 {quantiles[3]:.3f}\n"
+            f"風險區間人數：{histogram}\n"
+        )
+    else:
+        distribution = ""
+
+    top = df.loc[scores[~applied].nlargest(top_k).index, columns].copy()
+    top["離職風險"] = scores.loc[top.index].round(3)
+
+    return (
+        header +
+        f"{distribution}"
+        f"尚未申請離職者中風險最高的 {len(top)} 位員工:\n{top.to_dict(orient='records')}"
+    )
+
+
+def benchmark(model: dict, n: int = 100_000):
+    """以隨機資料測試大量評分的耗時。"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(np.asarray(model["mean"]), np.asarray(model["std"]), size=(n, len(FEATURES)))
+    start = time.perf_counter()
+    score_matrix(model, X)
+    elapsed = time.perf_counter() - start
+    print(f"評分 {n} 位員工耗時 {elapsed * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    # 用法：python attrition_risk.py train [CSV路徑] | bench [筆數]
+    command = sys.argv[1] if len(sys.argv) > 1 else "train"
+    if command == "train":
+        csv_file_path = sys.argv[2] if len(sys.argv) > 2 else "employee_data.csv"
+        model = train_model(pd.read_csv(csv_file_path))
+        save_model(model)
+        print(f"已訓練並輸出模型至 {MODEL_PATH}")
+        print(f"交叉驗證 AUC {model['cv_auc']:.3f}，固定方向指標 AUC {model['prior_auc']:.3f}，採用：{model['method']}")
+    elif command == "bench":
+        benchmark(load_model(), int(sys.argv[2]) if len(sys.argv) > 2 else 100_000)
+    else:
+        print("用法：python attrition_risk.py train [CSV路徑] | bench [筆數]")
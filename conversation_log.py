@@ -0,0 +1,214 @@
+import csv
+import time
+import uuid
+import sqlite3
+import argparse
+
+# 對話紀錄儲存（SQLite，逐筆追加）
+# 每則 TextMessage 一到就寫入並提交，程式中途當掉也不會遺失已收到的訊息；
+# 依 batch_start、source、timestamp 建索引，查詢單一批次或代理人時不需整檔掃描。
+# 每次執行 dataAgent3 有自己的 run_id，查詢與壓縮都以執行為單位，不同次執行的訊息不會混在一起。
+
+LOG_DB_PATH = "all_conversation_log.db"
+IMPORT_RUN_PREFIX = "import-"
+COLUMNS = ["run_id", "batch_start", "batch_end", "source", "content", "type", "prompt_tokens", "completion_tokens", "timestamp"]
+
+
+def new_run_id():
+    """依開始時間排序的執行代號，例如 20250101-093000-1a2b3c。"""
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+
+
+class ConversationLogStore:
+    def __init__(self, path=LOG_DB_PATH, run_id=None):
+        """run_id 為本次執行寫入訊息使用的代號；未指定時自動產生。"""
+        self.path = path
+        self.run_id = run_id or new_run_id()
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        # WAL 讓查詢與寫入可同時進行
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT,
+                batch_start INTEGER,
+                batch_end INTEGER,
+                source TEXT,
+                content TEXT,
+                type TEXT,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                timestamp REAL
+            )
+        """)
+        # 舊版資料庫沒有 run_id 欄位，補上後舊訊息歸在 legacy
+        if "run_id" not in {row["name"] for row in self.conn.execute("PRAGMA table_info(messages)")}:
+            self.conn.execute("ALTER TABLE messages ADD COLUMN run_id TEXT")
+            self.conn.execute("UPDATE messages SET run_id = 'legacy'")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_run ON messages (run_id, batch_start)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_batch_start ON messages (batch_start)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_source ON messages (source)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)")
+        self.conn.commit()
+
+    def append(self, record):
+        """追加一筆訊息並立即提交；record 沒有 run_id / timestamp 時使用本次執行代號與目前時間。"""
+        values = dict(record)
+        values.setdefault("run_id", self.run_id)
+        values.setdefault("timestamp", time.time())
+        self.conn.execute(
+            f"INSERT INTO messages ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+            [values.get(col) for col in COLUMNS]
+        )
+        self.conn.commit()
+
+    def runs(self):
+        """列出所有執行：代號、訊息筆數、開始與結束時間，由新到舊排序。"""
+        rows = self.conn.execute("""
+            SELECT run_id, COUNT(*) AS messages, MIN(timestamp) AS started, MAX(timestamp) AS ended
+            FROM messages GROUP BY run_id ORDER BY started DESC
+        """)
+        return [dict(row) for row in rows]
+
+    def latest_run(self):
+        """最新一次實際執行的代號（不含匯入的舊紀錄）。"""
+        runs = [run for run in self.runs() if not run["run_id"].startswith(IMPORT_RUN_PREFIX)]
+        return runs[0]["run_id"] if runs else None
+
+    def query(self, run_id=None, batch_start=None, source=None, since=None, until=None, limit=None):
+        """依條件取出訊息（皆走索引），依寫入順序回傳 dict 清單；run_id 為 None 時查詢所有執行。"""
+        conditions, params = [], []
+        if run_id is not None:
+            conditions.append("run_id = ?")
+            params.append(run_id)
+        if batch_start is not None:
+            conditions.append("batch_start = ?")
+            params.append(batch_start)
+        if source is not None:
+            conditions.append("source = ?")
+            params.append(source)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp <= ?")
+            params.append(until)
+
+        sql = f"SELECT {', '.join(COLUMNS)} FROM messages"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def delete_run(self, run_id):
+        """刪除單次執行的全部訊息（例如中途失敗、已重跑的那一次），回傳刪除筆數。"""
+        cursor = self.conn.execute("DELETE FROM messages WHERE run_id = ?", (run_id,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def compact(self, keep_runs=5):
+        """只保留最新的 keep_runs 次執行，整批刪除更早的執行並回收空間，回傳刪除筆數。"""
+        old_runs = [run["run_id"] for run in self.runs()[keep_runs:]]
+        deleted = 0
+        for run_id in old_runs:
+            deleted += self.conn.execute("DELETE FROM messages WHERE run_id = ?", (run_id,)).rowcount
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        return deleted
+
+    def export_csv(self, output_file, **filters):
+        rows = self.query(**filters)
+        with open(output_file, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS[1:-1], extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        return len(rows)
+
+    def import_csv(self, input_file, run_id=None):
+        """
+        匯入舊版 all_conversation_log.csv 為一次獨立的執行，回傳匯入筆數。
+        舊紀錄沒有時間，時間戳記設為比資料庫中所有訊息都早，排序上視為最舊的執行。
+        """
+        oldest = self.conn.execute("SELECT MIN(timestamp) FROM messages").fetchone()[0]
+        stamp = (oldest if oldest is not None else time.time()) - 1
+        run_id = run_id or IMPORT_RUN_PREFIX + new_run_id()
+        with open(input_file, newline="", encoding="utf-8-sig") as f:
+            rows = [[run_id] + [row.get(col) or None for col in COLUMNS[1:-1]] + [stamp] for row in csv.DictReader(f)]
+        self.conn.executemany(
+            f"INSERT INTO messages ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+            rows
+        )
+        self.conn.commit()
+        return len(rows)
+
+    def close(self):
+        self.conn.close()
+
+
+def query_log(path=LOG_DB_PATH, **filters):
+    store = ConversationLogStore(path)
+    try:
+        return store.query(**filters)
+    finally:
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="對話紀錄查詢工具")
+    parser.add_argument("--db", default=LOG_DB_PATH, help="SQLite 檔案路徑")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("runs", help="列出所有執行")
+
+    query_parser = sub.add_parser("query", help="依條件列出訊息（預設只查最新一次執行）")
+    query_parser.add_argument("--run", help="執行代號（預設為最新一次，不含匯入的舊紀錄）")
+    query_parser.add_argument("--all-runs", action="store_true", help="查詢所有執行")
+    query_parser.add_argument("--batch-start", type=int)
+    query_parser.add_argument("--source")
+    query_parser.add_argument("--since", type=float, help="起始 UNIX 時間")
+    query_parser.add_argument("--until", type=float, help="結束 UNIX 時間")
+    query_parser.add_argument("--limit", type=int)
+    query_parser.add_argument("--csv", help="輸出成 CSV 而不是印在終端機")
+
+    compact_parser = sub.add_parser("compact", help="刪除較舊的執行並回收空間")
+    compact_parser.add_argument("--keep", type=int, default=5, help="保留最新幾次執行")
+
+    delete_parser = sub.add_parser("delete-run", help="刪除單次執行的全部訊息")
+    delete_parser.add_argument("run_id")
+
+    import_parser = sub.add_parser("import", help="匯入舊版 CSV 紀錄")
+    import_parser.add_argument("csv_file")
+
+    args = parser.parse_args()
+    store = ConversationLogStore(args.db)
+    try:
+        if args.command == "runs":
+            for run in store.runs():
+                print(f"{run['run_id']}  {run['messages']} 筆  "
+                      f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['started']))} ~ "
+                      f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['ended']))}")
+        elif args.command == "query":
+            run_id = None if args.all_runs else (args.run or store.latest_run())
+            filters = {"run_id": run_id, "batch_start": args.batch_start, "source": args.source,
+                       "since": args.since, "until": args.until, "limit": args.limit}
+            if args.csv:
+                print(f"已輸出 {store.export_csv(args.csv, **filters)} 筆至 {args.csv}")
+            else:
+                for row in store.query(**filters):
+                    print(f"[{row['run_id']}][{row['batch_start']}-{row['batch_end']}][{row['source']}] => {row['content']}\n")
+        elif args.command == "compact":
+            print(f"已刪除 {store.compact(args.keep)} 筆較舊執行的訊息")
+        elif args.command == "delete-run":
+            print(f"已刪除 {store.delete_run(args.run_id)} 筆訊息")
+        elif args.command == "import":
+            print(f"已匯入 {store.import_csv(args.csv_file)} 筆訊息")
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
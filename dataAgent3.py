@@ -1,8 +1,12 @@
 import os
+import time
 import asyncio
 import pandas as pd
 from dotenv import load_dotenv
 import io
+from attrition_risk import load_or_train, score_employees, risk_context
+from conversation_log import ConversationLogStore
+from model_router import model_router
 
 # 根據你的專案結構調整下列 import
 from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
@@ -14,26 +18,56 @@ from autogen_ext.agents.web_surfer import MultimodalWebSurfer
 
 load_dotenv()
 
+# 每批只把離職風險最高的前 K 位員工放進提示
+RISK_TOP_K = 20
+
+
+class RoutedChatCompletionClient:
+    """
+    依路由政策選模型的 autogen 模型用戶端：每次 create() 都重新選模型並記錄延遲，
+    p95 超標降級後下一次呼叫就會改用較快的模型。其餘屬性轉給目前選中模型的 OpenAIChatCompletionClient。
+    """
+    def __init__(self, task, **client_kwargs):
+        self.task = task
+        self.client_kwargs = client_kwargs
+        self.clients = {}
+
+    def _client(self, model):
+        if model not in self.clients:
+            self.clients[model] = OpenAIChatCompletionClient(model=model, **self.client_kwargs)
+        return self.clients[model]
+
+    async def create(self, *args, **kwargs):
+        model = model_router.select(self.task)
+        start = time.monotonic()
+        result = await self._client(model).create(*args, **kwargs)
+        model_router.record(self.task, model, time.monotonic() - start)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._client(model_router.select(self.task)), name)
+
 #HW1 change prompt
-async def process_chunk(chunk, start_idx, total_records, model_client, termination_condition):
+async def process_chunk(chunk, start_idx, total_records, model_client, termination_condition, risk_model, log_store):
     """
     處理單一批次資料：
-      - 將該批次資料轉成 dict 格式
+      - 先用本地模型計算離職風險，只取風險分佈與前 RISK_TOP_K 名高風險員工
       - 組出提示，要求各代理人根據該批次資料進行分析，
         並提供員工離職預警、績效預測、心情預測及職務薪資分析等建議。
       - 請 MultimodalWebSurfer 代理人利用外部網站搜尋功能，
         搜尋最新的員工管理與人力資源趨勢（例如員工留任策略、薪酬趨勢、職場心理健康等），
         並將搜尋結果納入分析建議中。
-      - 收集所有回覆訊息並返回。
+      - 每則回覆一收到就寫入 log_store，並收集所有回覆訊息返回。
     """
-    # 將資料轉成 dict 格式
-    chunk_data = chunk.to_dict(orient='records')
+    # 本地計算離職風險，LLM 不需要再從原始資料推算
+    risk_scores = score_employees(chunk, risk_model)
     prompt = (
         f"目前正在處理第 {start_idx} 至 {start_idx + len(chunk) - 1} 筆資料（共 {total_records} 筆）。\n"
-        f"以下為該批次員工資料:\n{chunk_data}\n\n"
+        f"以下為本地計算的離職風險資料（0~1，越高風險越高；評分方式與可信度見第一行，未提供排序時附原始數據，請自行判斷）:\n"
+        f"{risk_context(chunk, risk_scores, risk_model, RISK_TOP_K)}\n\n"
         "請根據以上資料進行分析，並提供完整的員工管理建議。"
         "其中請特別注意：\n"
-        "  1. 分析員工的工作表現、滿意度與可能的離職風險；\n"
+        "  1. 根據離職風險資料分析高風險員工（含已申請離職者）的工作表現與滿意度；\n"
         "  2. 請 MultimodalWebSurfer 搜尋外部網站，找出最新的職場趨勢與人力資源管理建議（例如員工留任策略、薪酬趨勢、職場心理健康等），\n"
         "     並將搜尋結果整合進回覆中；\n"
         "  3. 最後請提供具體的管理建議，幫助企業提升員工留任率與績效表現。\n"
@@ -55,7 +89,7 @@ async def process_chunk(chunk, start_idx, total_records, model_client, terminati
         if isinstance(event, TextMessage):
             # 印出目前哪個 agent 正在運作，方便追蹤
             print(f"[{event.source}] => {event.content}\n")
-            messages.append({
+            message = {
                 "batch_start": start_idx,
                 "batch_end": start_idx + len(chunk) - 1,
                 "source": event.source,
@@ -63,7 +97,9 @@ async def process_chunk(chunk, start_idx, total_records, model_client, terminati
                 "type": event.type,
                 "prompt_tokens": event.models_usage.prompt_tokens if event.models_usage else None,
                 "completion_tokens": event.models_usage.completion_tokens if event.models_usage else None
-            })
+            }
+            log_store.append(message)
+            messages.append(message)
     return messages
 
 async def main():
@@ -72,9 +108,9 @@ async def main():
         print("請檢查 .env 檔案中的 GEMINI_API_KEY。")
         return
 
-    # 初始化模型用戶端 (此處示範使用 gemini-2.0-flash)
-    model_client = OpenAIChatCompletionClient(
-        model="gemini-2.0-flash",
+    # 初始化模型用戶端（多代理人綜合分析，每次呼叫由路由政策決定模型，預設 gemini-2.0-flash）
+    model_client = RoutedChatCompletionClient(
+        "multi_agent_synthesis",
         api_key=gemini_api_key,
     )
     
@@ -86,6 +122,10 @@ async def main():
     chunk_size = 1000
     chunks = list(pd.read_csv(csv_file_path, chunksize=chunk_size))
     total_records = sum(chunk.shape[0] for chunk in chunks)
+    risk_model = load_or_train(csv_file_path)
+    # 對話紀錄逐筆寫入 SQLite，中途失敗也能保留已完成的部分
+    log_store = ConversationLogStore()
+    print(f"📝 本次對話紀錄代號：{log_store.run_id}")
     
     # 利用 map 與 asyncio.gather 同時處理所有批次（避免使用傳統 for 迴圈）
     tasks = list(map(
@@ -94,12 +134,17 @@ async def main():
             idx_chunk[0] * chunk_size,
             total_records,
             model_client,
-            termination_condition
+            termination_condition,
+            risk_model,
+            log_store
         ),
         enumerate(chunks)
     ))
     
-    results = await asyncio.gather(*tasks)
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        log_store.close()
     # 將所有批次的訊息平坦化成一個清單
     all_messages = [msg for batch in results for msg in batch]
     
@@ -107,7 +152,7 @@ async def main():
     df_log = pd.DataFrame(all_messages)
     output_file = "all_conversation_log.csv"
     df_log.to_csv(output_file, index=False, encoding="utf-8-sig")
-    print(f"已將所有對話紀錄輸出為 {output_file}")
+    print(f"已將所有對話紀錄輸出為 {output_file}（逐筆紀錄可用 python conversation_log.py query --run {log_store.run_id} 查詢）")
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,80 @@
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 本機假模型伺服器：模擬模型 API 的隨機失敗與長尾延遲，
+# 用來在不花費額度的情況下測試 llm_resilience 的重試、對沖與斷路行為。
+# bad_request_rate 模擬請求本身有誤（400），這類錯誤不應重試。
+
+
+class FakeLLMServer:
+    def __init__(self, failure_rate: float = 0.1, slow_rate: float = 0.05,
+                 fast_delay: float = 0.02, slow_delay: float = 1.0, seed: int = 0, bad_request_rate: float = 0.0):
+        self.failure_rate = failure_rate
+        self.bad_request_rate = bad_request_rate
+        self.slow_rate = slow_rate
+        self.fast_delay = fast_delay
+        self.slow_delay = slow_delay
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.requests = 0
+        self.server = None
+        self.thread = None
+
+    def _roll(self) -> float:
+        with self.random_lock:
+            self.requests += 1
+            return self.random.random()
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                roll = fake._roll()
+                if roll < fake.bad_request_rate:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                roll -= fake.bad_request_rate
+                if 0 <= roll < fake.failure_rate:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                time.sleep(fake.slow_delay if roll < fake.failure_rate + fake.slow_rate else fake.fast_delay)
+                body = "員工ID：E0001\n反饋總結：假回應\n正負面評分：正面".encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_POST = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
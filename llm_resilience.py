@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# 模型呼叫的韌性層：
+#   - 暫時性錯誤（逾時、連線中斷、429、5xx）以帶抖動的指數退避重試；
+#     其他錯誤（提示被擋、400 參數錯誤、401/403 授權失敗）重試也不會成功，直接拋出
+#   - （選用）呼叫超過近期延遲的百分位門檻時，再送一個重複請求，取先回來的結果；
+#     會重複計費，預設關閉，可用參數或環境變數 LLM_HEDGE=1 開啟
+#   - 連續多次呼叫（重試用盡後才算一次）因暫時性錯誤失敗時斷路，在冷卻時間內直接失敗，不再打 API
+# 適用任何同步呼叫，例如 model.generate_content 或 client.models.generate_content。
+
+HEDGE_ENABLED = os.getenv("LLM_HEDGE") == "1"
+# 值得重試的 HTTP 狀態碼
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# 沒有狀態碼時，依例外類別名稱判斷（google.api_core、google.genai、openai 等 SDK）
+TRANSIENT_ERROR_NAMES = ("Timeout", "DeadlineExceeded", "TooManyRequests", "ResourceExhausted", "RateLimit",
+                         "ServiceUnavailable", "InternalServerError", "ServerError", "APIConnectionError")
+
+
+class CircuitOpenError(Exception):
+    """斷路器開啟中，呼叫被直接拒絕。"""
+
+
+def _status_code(error):
+    for value in (getattr(error, "code", None), getattr(error, "status_code", None),
+                  getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_transient(error: Exception) -> bool:
+    """判斷錯誤是否為暫時性（重試可能成功）。"""
+    status = _status_code(error)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # urllib 連線失敗（URLError 沒有狀態碼）
+    if type(error).__name__ == "URLError":
+        return True
+    return any(name in cls.__name__ for cls in type(error).__mro__ for name in TRANSIENT_ERROR_NAMES)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """
+        斷路中且尚未冷卻完畢時拋出 CircuitOpenError；
+        冷卻後進入半開狀態，只放行一個試探呼叫，試探結果回來前其他呼叫仍被拒絕。
+        """
+        with self.lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError("模型服務暫時無法使用（斷路器開啟中）")
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self.probing:
+                    raise CircuitOpenError("模型服務暫時無法使用（斷路器試探中）")
+                self.probing = True
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class ResilientCaller:
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 hedge: bool = None, hedge_percentile: float = 95, hedge_min_samples: int = 20,
+                 breaker: CircuitBreaker = None, max_workers: int = 8, retry_on=is_transient):
+        """hedge 為 None 時依環境變數 LLM_HEDGE 決定；retry_on(例外) 回傳 True 才重試。"""
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = HEDGE_ENABLED if hedge is None else hedge
+        self.retry_on = retry_on
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = deque(maxlen=200)
+        self.counters = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "failures": 0, "rejected": 0}
+        self.lock = threading.Lock()
+        self.max_workers = max_workers
+        self.executor = None
+        # 每個執行緒最近一次成功嘗試的延遲（不含重試前的退避等待），供模型路由使用
+        self.local = threading.local()
+
+    def _executor(self):
+        # 第一次對沖時才建立執行緒池
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self.executor
+
+    def _count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _backoff(self, attempt: int) -> float:
+        # full jitter：在 [0, base * 2^attempt] 之間隨機等待，避免多個請求同時重試
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _hedge_threshold(self):
+        """近期成功呼叫延遲的百分位數；樣本不足時不對沖。"""
+        with self.lock:
+            if len(self.latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return ordered[index]
+
+    def _record_latency(self, start: float):
+        latency = time.monotonic() - start
+        self.local.last_latency = latency
+        with self.lock:
+            self.latencies.append(latency)
+
+    def last_latency(self):
+        """目前執行緒最近一次成功嘗試的延遲；尚未成功過時為 None。"""
+        return getattr(self.local, "last_latency", None)
+
+    def _attempt(self, fn, args, kwargs):
+        start = time.monotonic()
+        threshold = self._hedge_threshold() if self.hedge else None
+        if threshold is None:
+            result = fn(*args, **kwargs)
+            self._record_latency(start)
+            return result
+
+        executor = self._executor()
+        primary = executor.submit(fn, *args, **kwargs)
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            result = primary.result()
+            self._record_latency(start)
+            return result
+
+        # 超過門檻仍未回應：送出對沖請求，取先成功的一個（較慢的那個結果直接丟棄）
+        self._count("hedges")
+        backup = executor.submit(fn, *args, **kwargs)
+        pending = [primary, backup]
+        error = None
+        while pending:
+            done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        self._count("hedge_wins")
+                    self._record_latency(start)
+                    return future.result()
+                error = future.exception()
+                # 非暫時性錯誤另一個請求也會一樣失敗，不必再等
+                if not self.retry_on(error):
+                    raise error
+            pending = list(not_done)
+        raise error
+
+    def call(self, fn, *args, **kwargs):
+        """
+        以重試、對沖與斷路保護執行 fn(*args, **kwargs)。
+        非暫時性錯誤立即拋出；暫時性錯誤重試用盡後拋出最後一次的例外，並只算斷路器的一次失敗。
+        """
+        self._count("calls")
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._count("rejected")
+            raise
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count("retries")
+            try:
+                result = self._attempt(fn, args, kwargs)
+            except Exception as e:
+                if not self.retry_on(e):
+                    # 服務有回應，只是這個請求本身有問題：不重試，也不算服務故障
+                    self.breaker.record_success()
+                    self._count("failures")
+                    raise
+                last_error = e
+                if attempt < self.max_retries:
+                    time.sleep(self._backoff(attempt))
+                continue
+            self.breaker.record_success()
+            return result
+
+        self.breaker.record_failure()
+        self._count("failures")
+        raise last_error
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+        stats["circuit"] = self.breaker.state
+        return stats
+
+    def report(self) -> str:
+        s = self.stats()
+        return (f"模型呼叫 {s['calls']} 次，重試 {s['retries']} 次，對沖 {s['hedges']} 次"
+                f"（對沖勝出 {s['hedge_wins']} 次），失敗 {s['failures']} 次，斷路拒絕 {s['rejected']} 次，"
+                f"斷路器狀態 {s['circuit']}")
+
+
+def demo(total_calls: int = 200):
+    """對本機假模型伺服器發出請求，比較有無韌性層時的失敗數與延遲。"""
+    import urllib.request
+    from fake_llm_server import FakeLLMServer
+
+    def percentile(values, p):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    with FakeLLMServer(failure_rate=0.1, slow_rate=0.05) as server:
+        def generate():
+            with urllib.request.urlopen(server.url, timeout=10) as response:
+                return response.read().decode("utf-8")
+
+        for label, caller in [("單次呼叫", None),
+                              ("重試 + 對沖", ResilientCaller(base_delay=0.01, hedge=True, breaker=CircuitBreaker(failure_threshold=50)))]:
+            latencies, failures = [], 0
+            for _ in range(total_calls):
+                start = time.monotonic()
+                try:
+                    caller.call(generate) if caller else generate()
+                except Exception:
+                    failures += 1
+                latencies.append(time.monotonic() - start)
+            print(f"[{label}] 失敗 {failures}/{total_calls}，"
+                  f"P50 {percentile(latencies, 50) * 1000:.0f} ms，P99 {percentile(latencies, 99) * 1000:.0f} ms")
+            if caller:
+                print(f"[{label}] {caller.report()}")
+
+    # 請求本身有誤（400）：不重試，也不會讓斷路器開啟
+    with FakeLLMServer(failure_rate=0.0, slow_rate=0.0, bad_request_rate=1.0) as server:
+        caller = ResilientCaller(base_delay=0.01)
+        for _ in range(10):
+            try:
+                caller.call(urllib.request.urlopen, server.url, timeout=10)
+            except Exception:
+                pass
+        print(f"[400 錯誤 10 次] {caller.report()}，伺服器收到 {server.requests} 個請求")
+
+
+if __name__ == '__main__':
+    # 用法：python llm_resilience.py [呼叫次數]
+    demo(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
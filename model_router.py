@@ -0,0 +1,115 @@
+import os
+import time
+import threading
+from collections import deque
+
+# 模型分級路由：依任務類型選擇模型，不再在各腳本中寫死模型名稱。
+#   - 逐筆分類（row_classification）用最便宜、最快的模型
+#   - 摘要（summarization）用一般模型
+#   - 多代理人綜合分析（multi_agent_synthesis）才用較大的模型
+# 每個任務有延遲（p95）與成本上限；近期 p95 超過目標時自動降到更快的一級，冷卻後再嘗試原本的模型。
+# 可用環境變數 MODEL_ROUTE_<任務名稱大寫> 指定級別或模型名稱，例如 MODEL_ROUTE_SUMMARIZATION=lite。
+
+# 由快到慢排列；cost 為每百萬輸入 token 的美元價格（概估，用於成本上限比較）
+TIERS = [
+    {"name": "lite", "model": "gemini-1.5-flash-8b", "cost": 0.0375},
+    {"name": "flash", "model": "gemini-1.5-flash", "cost": 0.075},
+    {"name": "flash-2", "model": "gemini-2.0-flash", "cost": 0.10},
+    {"name": "pro", "model": "gemini-1.5-pro", "cost": 1.25},
+]
+
+TASK_POLICIES = {
+    "row_classification": {"tier": "lite", "p95_target": 8.0, "max_cost": 0.075},
+    "summarization": {"tier": "flash", "p95_target": 15.0, "max_cost": 0.10},
+    "multi_agent_synthesis": {"tier": "flash-2", "p95_target": 30.0, "max_cost": 1.25},
+}
+
+
+def tier_index(name_or_model: str) -> int:
+    for i, tier in enumerate(TIERS):
+        if name_or_model in (tier["name"], tier["model"]):
+            return i
+    raise ValueError(f"未知的模型級別：{name_or_model}")
+
+
+class ModelRouter:
+    def __init__(self, policies: dict = None, window: int = 50, min_samples: int = 10, cooldown: float = 300.0):
+        self.policies = policies or TASK_POLICIES
+        self.window = window
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.latencies = {}
+        self.degraded = {}
+        self.lock = threading.Lock()
+
+    def preferred_index(self, task: str) -> int:
+        """政策（或環境變數）指定的級別，超過成本上限時往下調到上限內最大的一級。"""
+        policy = self.policies[task]
+        index = tier_index(os.getenv(f"MODEL_ROUTE_{task.upper()}", policy["tier"]))
+        while index > 0 and TIERS[index]["cost"] > policy["max_cost"]:
+            index -= 1
+        return index
+
+    def select(self, task: str) -> str:
+        index = self.preferred_index(task)
+        with self.lock:
+            fallback = self.degraded.get(task)
+            if fallback:
+                if time.monotonic() < fallback["until"]:
+                    index = min(index, fallback["index"])
+                else:
+                    del self.degraded[task]
+        return TIERS[index]["model"]
+
+    def p95(self, task: str, model: str):
+        with self.lock:
+            samples = sorted(self.latencies.get((task, model), ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def record(self, task: str, model: str, latency: float):
+        """記錄一次成功呼叫的延遲；p95 超標時讓該任務暫時降一級。"""
+        key = (task, model)
+        with self.lock:
+            samples = self.latencies.setdefault(key, deque(maxlen=self.window))
+            samples.append(latency)
+            if len(samples) < self.min_samples:
+                return
+            ordered = sorted(samples)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            index = tier_index(model)
+            if p95 <= self.policies[task]["p95_target"] or index == 0:
+                return
+            self.degraded[task] = {"index": index - 1, "until": time.monotonic() + self.cooldown}
+            # 清掉舊樣本，冷卻結束回到原模型時重新量測
+            samples.clear()
+        print(f"⚠ {task} 使用 {model} 的 p95 延遲 {p95:.1f}s 超過目標，暫時改用 {TIERS[index - 1]['model']}")
+
+    def call(self, task: str, fn, caller=None):
+        """
+        以路由選出的模型名稱呼叫 fn(model)，並記錄延遲。
+        fn 經由 ResilientCaller 呼叫時傳入 caller，只記錄成功那次嘗試的延遲，不把重試的退避等待算進模型延遲。
+        """
+        model = self.select(task)
+        start = time.monotonic()
+        result = fn(model)
+        latency = caller.last_latency() if caller is not None else None
+        self.record(task, model, latency if latency is not None else time.monotonic() - start)
+        return result
+
+    def report(self) -> str:
+        lines = []
+        for task in self.policies:
+            model = self.select(task)
+            p95 = self.p95(task, model)
+            lines.append(f"{task}: {model}" + (f"（p95 {p95:.1f}s）" if p95 is not None else ""))
+        return "；".join(lines)
+
+
+# 全專案共用的路由器
+model_router = ModelRouter()
+
+
+def select_model(task: str) -> str:
+    return model_router.select(task)